@@ -0,0 +1,77 @@
+"""
+One-shot migration: convert ISO-string datetimes written by the old
+prepare_for_mongo() into native BSON dates, so date fields sort and
+range-query correctly.
+
+Usage (from backend/):
+    python migrate_datetimes.py
+
+Safe to re-run; only string-typed values are touched.
+"""
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# collection -> top-level fields that used to be stored as ISO strings
+DATETIME_FIELDS = {
+    "users": ["created_at"],
+    "rounds": ["created_at", "tee_time", "completed_at"],
+    "subject_profiles": ["created_at"],
+    "clips": ["published_at", "updated_at"],
+    "vision_events": ["timestamp"],
+    "capture_triggers": ["triggered_at"],
+}
+
+BATCH_SIZE = 1000
+
+def _parse_iso(value: str):
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    # Naive values were written from UTC timestamps
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def migrate_collection(collection, fields) -> int:
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {field: 1 for field in fields}
+    ops = []
+    migrated = 0
+
+    for doc in collection.find(query, projection):
+        updates = {}
+        for field in fields:
+            value = doc.get(field)
+            if isinstance(value, str):
+                parsed = _parse_iso(value)
+                if parsed is not None:
+                    updates[field] = parsed
+        if updates:
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": updates}))
+
+        if len(ops) >= BATCH_SIZE:
+            migrated += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+
+    if ops:
+        migrated += collection.bulk_write(ops, ordered=False).modified_count
+    return migrated
+
+def main():
+    client = MongoClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        for name, fields in DATETIME_FIELDS.items():
+            count = migrate_collection(db[name], fields)
+            print(f"[migrate] {name}: {count} document(s) converted")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    main()
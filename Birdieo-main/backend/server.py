@@ -1,12 +1,15 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Form
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import ConnectionFailure
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, ValidationError
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
@@ -15,6 +18,12 @@ import jwt
 import base64
 from enum import Enum
 import asyncio
+import hashlib
+import re
+import time
+import orjson
+import httpx
+from cachetools import TTLCache
 
 # Load environment variables
 load_dotenv()
@@ -28,11 +37,19 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware so BSON dates come back as UTC-aware datetimes, matching what we write
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
+# Shared upstream HTTP client; HTTP/2 multiplexes repeated requests to the same origin
+_http = httpx.AsyncClient(timeout=10.0, http2=True)
+
 # Create the main app without a prefix
-app = FastAPI(title="Birdieo API", description="Golf shot capture platform")
+app = FastAPI(
+    title="Birdieo API",
+    description="Golf shot capture platform",
+    default_response_class=ORJSONResponse
+)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -40,8 +57,54 @@ api_router = APIRouter(prefix="/api")
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
+BCRYPT_ROUNDS = 12   # bcrypt work factor (its default), pinned so the cost is explicit
+# Encoded once so signing/verification don't re-encode the secret per call
+_JWT_SECRET_BYTES = JWT_SECRET.encode('utf-8')
 security = HTTPBearer()
 
+# AI Configuration
+EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
+
+# Test fixture endpoint; leave unset outside test deployments
+ENABLE_TEST_SEED = os.environ.get('ENABLE_TEST_SEED', '').lower() in ('1', 'true', 'yes')
+CLOTHING_ANALYSIS_SYSTEM_MESSAGE = "You are an expert at analyzing golf attire. Analyze the clothing in the image and return specific details about colors and styles suitable for golf player identification."
+CLOTHING_ANALYSIS_PROMPT = """
+        Analyze this golf attire photo and identify the following clothing details:
+        
+        1. Top color (white, black, red, blue, green, yellow, gray, navy, etc.)
+        2. Top style (polo, t-shirt, sweater, jacket, vest)
+        3. Bottom color (khaki, white, black, navy, gray, brown)
+        4. Hat color if visible (white, black, red, blue, green, none)
+        5. Shoe color if visible (white, black, brown, gray)
+        
+        Return your analysis in this exact JSON format:
+        {
+            "top_color": "color_name",
+            "top_style": "style_name", 
+            "bottom_color": "color_name",
+            "hat_color": "color_name_or_none",
+            "shoes_color": "color_name",
+            "confidence": 0.85,
+            "detected_items": ["polo shirt", "khaki pants", "white shoes"]
+        }
+        
+        Focus on the most prominent and clearly visible clothing items. Use standard color names.
+        """
+# Outermost JSON object in an LLM reply, tolerating code fences or surrounding prose
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+# Verified tokens: sha256(token)[:16] -> payload. Failures are never cached.
+_token_cache: TTLCache = TTLCache(maxsize=10000, ttl=30)
+# Hydrated users: user_id -> User. Invalidated on profile updates.
+_user_cache: TTLCache = TTLCache(maxsize=5000, ttl=60)
+# Authenticated requests never need the password hash; login reads it with its own query
+_AUTH_USER_PROJECTION = {"_id": 0, "password_hash": 0}
+# AI clothing analysis: sha256(photo) -> ClothingAnalysisResult. Only parsed results are cached.
+_clothing_cache: TTLCache = TTLCache(maxsize=1024, ttl=24 * 60 * 60)
+# Failed login attempts: email -> count, cleared on success or after the window lapses
+MAX_FAILED_LOGINS = 5
+_failed_logins: TTLCache = TTLCache(maxsize=10000, ttl=15 * 60)
+
 # Enums
 class UserRole(str, Enum):
     PLAYER = "player"
@@ -172,6 +235,12 @@ class ClothingAnalysisResult(BaseModel):
     confidence: float
     detected_items: List[str]
 
+class PhotoBatchAnalysisRequest(BaseModel):
+    face_photo: str  # base64
+    front_photo: str  # base64
+    side_photo: str  # base64
+    back_photo: str  # base64
+
 class PhotoCaptureRequest(BaseModel):
     round_id: str
     face_photo: str  # base64
@@ -180,12 +249,41 @@ class PhotoCaptureRequest(BaseModel):
     back_photo: str  # base64
     clothing_descriptor: ClothingDescriptor
 
-# Helper Functions
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+class TestSeedRequest(BaseModel):
+    user: UserCreate
+    checkin: CheckinRequest
+    photos: PhotoBatchAnalysisRequest
+    clothing_descriptor: ClothingDescriptor
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+# Helper Functions
+def user_from_mongo(user_dict: dict) -> User:
+    """Rehydrate a User document we wrote ourselves without re-running validation"""
+    user_fields = parse_from_mongo(user_dict)
+    # Documents read with _AUTH_USER_PROJECTION carry no hash
+    user_fields.setdefault('password_hash', '')
+    # model_construct skips coercion, so restore the enum types serialization expects
+    user_fields['role'] = UserRole(user_fields.get('role', UserRole.PLAYER))
+    if user_fields.get('handedness') is not None:
+        user_fields['handedness'] = Handedness(user_fields['handedness'])
+    return User.model_construct(**user_fields)
+
+def user_response_from_dict(user_dict: dict) -> UserResponse:
+    """Build a UserResponse from already-validated User data without re-validating it"""
+    return UserResponse.model_construct(**{k: user_dict[k] for k in UserResponse.model_fields})
+
+def strip_data_url(photo_data: str) -> str:
+    """Remove a data URL prefix (e.g. "data:image/jpeg;base64,") if present"""
+    # Single scan and single slice; split() would copy every segment of a multi-MB payload
+    idx = photo_data.find(',')
+    return photo_data[idx + 1:] if idx >= 0 else photo_data
+
+# bcrypt is deliberately slow (~250 ms at the default 12 rounds); run it off the event loop
+async def hash_password(password: str) -> str:
+    hashed = await asyncio.to_thread(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    return hashed.decode('utf-8')
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await asyncio.to_thread(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
 
 def create_jwt_token(user_id: str, email: str) -> str:
     payload = {
@@ -193,90 +291,99 @@ def create_jwt_token(user_id: str, email: str) -> str:
         'email': email,
         'exp': datetime.now(timezone.utc) + timedelta(days=30)
     }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return jwt.encode(payload, _JWT_SECRET_BYTES, algorithm=JWT_ALGORITHM)
+
+def _token_cache_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode('utf-8')).digest()[:16]
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_id = payload.get('user_id')
-        if not user_id:
+    cache_key = _token_cache_key(credentials.credentials)
+    payload = _token_cache.get(cache_key)
+    # Never serve a token past its own expiry, even if the cache entry is still live
+    if payload is None or payload['exp'] <= time.time():
+        try:
+            # exp is required: the cache check above relies on it
+            payload = jwt.decode(credentials.credentials, _JWT_SECRET_BYTES, algorithms=[JWT_ALGORITHM],
+                                 options={"require": ["exp"]})
+        except jwt.ExpiredSignatureError:
+            _token_cache.pop(cache_key, None)
+            raise HTTPException(status_code=401, detail="Token expired")
+        except jwt.InvalidTokenError:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        user_dict = await db.users.find_one({"id": user_id})
+        if not payload.get('user_id'):
+            raise HTTPException(status_code=401, detail="Invalid token")
+        _token_cache[cache_key] = payload
+    
+    user_id = payload['user_id']
+    user = _user_cache.get(user_id)
+    if user is None:
+        user_dict = await db.users.find_one({"id": user_id}, _AUTH_USER_PROJECTION)
         if not user_dict:
             raise HTTPException(status_code=401, detail="User not found")
         
-        return User(**user_dict)
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        user = user_from_mongo(user_dict)
+        _user_cache[user_id] = user
+    
+    return user
+
+async def get_current_round(round_id: str, current_user: User = Depends(get_current_user)) -> dict:
+    """Load the round from the path if it belongs to the current user.
+
+    Shares the per-request get_current_user result, so routes declaring both pay for one user lookup.
+    """
+    round_dict = await db.rounds.find_one({"id": round_id, "user_id": current_user.id})
+    if not round_dict:
+        raise HTTPException(status_code=404, detail="Round not found")
+    return round_dict
+
+def new_clothing_analysis_chat() -> LlmChat:
+    """Create a clothing-analysis chat session from the module-level configuration.
+
+    Each analysis gets its own session so concurrent calls never share message history.
+    """
+    if not EMERGENT_LLM_KEY:
+        raise HTTPException(status_code=500, detail="AI service not configured")
+    
+    return LlmChat(
+        api_key=EMERGENT_LLM_KEY,
+        session_id=f"clothing_analysis_{uuid.uuid4()}",
+        system_message=CLOTHING_ANALYSIS_SYSTEM_MESSAGE
+    ).with_model("openai", "gpt-4o-mini")
 
 async def analyze_clothing_from_photo(photo_base64: str) -> ClothingAnalysisResult:
     """Analyze clothing details from a photo using AI"""
+    cache_key = hashlib.sha256(photo_base64.encode('utf-8')).digest()
+    cached = _clothing_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
-        # Initialize LLM chat with Emergent key
-        emergent_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not emergent_key:
-            raise HTTPException(status_code=500, detail="AI service not configured")
-        
-        chat = LlmChat(
-            api_key=emergent_key,
-            session_id=f"clothing_analysis_{uuid.uuid4()}",
-            system_message="You are an expert at analyzing golf attire. Analyze the clothing in the image and return specific details about colors and styles suitable for golf player identification."
-        ).with_model("openai", "gpt-4o-mini")
+        chat = new_clothing_analysis_chat()
         
         # Create image content from base64
         image_content = ImageContent(image_base64=photo_base64)
         
-        # Create analysis prompt
-        analysis_prompt = """
-        Analyze this golf attire photo and identify the following clothing details:
-        
-        1. Top color (white, black, red, blue, green, yellow, gray, navy, etc.)
-        2. Top style (polo, t-shirt, sweater, jacket, vest)
-        3. Bottom color (khaki, white, black, navy, gray, brown)
-        4. Hat color if visible (white, black, red, blue, green, none)
-        5. Shoe color if visible (white, black, brown, gray)
-        
-        Return your analysis in this exact JSON format:
-        {
-            "top_color": "color_name",
-            "top_style": "style_name", 
-            "bottom_color": "color_name",
-            "hat_color": "color_name_or_none",
-            "shoes_color": "color_name",
-            "confidence": 0.85,
-            "detected_items": ["polo shirt", "khaki pants", "white shoes"]
-        }
-        
-        Focus on the most prominent and clearly visible clothing items. Use standard color names.
-        """
-        
         # Send message with image
         user_message = UserMessage(
-            text=analysis_prompt,
+            text=CLOTHING_ANALYSIS_PROMPT,
             file_contents=[image_content]
         )
         
         response = await chat.send_message(user_message)
         
         # Parse JSON response
-        import json
         try:
             # Extract JSON from response (in case there's extra text)
-            response_text = response.strip()
-            if '```json' in response_text:
-                json_start = response_text.find('{')
-                json_end = response_text.rfind('}') + 1
-                json_text = response_text[json_start:json_end]
-            else:
-                json_text = response_text
-                
-            analysis_data = json.loads(json_text)
-            return ClothingAnalysisResult(**analysis_data)
+            match = _JSON_OBJECT_RE.search(response)
+            json_text = match.group(0) if match else response
+            
+            analysis_data = orjson.loads(json_text)
+            result = ClothingAnalysisResult(**analysis_data)
+            _clothing_cache[cache_key] = result
+            return result
             
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             # Fallback: create default analysis
             logger.warning(f"Failed to parse AI response: {e}")
             return ClothingAnalysisResult(
@@ -302,34 +409,36 @@ async def analyze_clothing_from_photo(photo_base64: str) -> ClothingAnalysisResu
             detected_items=["error in analysis"]
         )
 
-def prepare_for_mongo(data: dict) -> dict:
-    """Convert datetime objects to ISO strings for MongoDB storage"""
-    result = {}
-    for key, value in data.items():
-        if isinstance(value, datetime):
-            result[key] = value.isoformat()
-        elif isinstance(value, dict):
-            result[key] = prepare_for_mongo(value)
-        else:
-            result[key] = value
-    return result
+# Datetimes are stored as native BSON dates; documents written before that change hold
+# ISO strings under these keys, which parse_from_mongo still converts back to datetime
+# (see migrate_datetimes.py for the one-shot conversion)
+_DATETIME_KEYS = frozenset({
+    'created_at', 'tee_time', 'completed_at', 'published_at',
+    'triggered_at', 'updated_at', 'timestamp',
+})
 
 def parse_from_mongo(item: dict) -> dict:
-    """Convert ISO strings back to datetime objects from MongoDB and handle ObjectId"""
+    """Drop MongoDB's ObjectId and convert legacy ISO-string datetimes back to datetime objects"""
     result = {}
-    for key, value in item.items():
-        # Skip MongoDB's _id field, we use our own id field
-        if key == '_id':
-            continue
-        elif key in ['created_at', 'tee_time', 'completed_at', 'published_at'] and isinstance(value, str):
-            try:
-                result[key] = datetime.fromisoformat(value.replace('Z', '+00:00'))
-            except ValueError:
-                result[key] = value
-        elif isinstance(value, dict):
-            result[key] = parse_from_mongo(value)
-        else:
-            result[key] = value
+    stack = [(item, result)]
+    while stack:
+        source, target = stack.pop()
+        for key, value in source.items():
+            # Skip MongoDB's _id field, we use our own id field
+            if key == '_id':
+                continue
+            value_type = type(value)
+            if value_type is dict:
+                nested = {}
+                target[key] = nested
+                stack.append((value, nested))
+            elif value_type is str and key in _DATETIME_KEYS:
+                try:
+                    target[key] = datetime.fromisoformat(value.replace('Z', '+00:00'))
+                except ValueError:
+                    target[key] = value
+            else:
+                target[key] = value
     return result
 
 # Generate mock timeline based on tee time
@@ -355,15 +464,15 @@ async def register(user_data: UserCreate):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create user
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     user = User(
         email=user_data.email,
         password_hash=hashed_password,
         name=user_data.name
     )
     
-    user_dict = prepare_for_mongo(user.dict())
-    await db.users.insert_one(user_dict)
+    user_data_dict = user.dict()
+    await db.users.insert_one(user_data_dict)
     
     # Create JWT token
     token = create_jwt_token(user.id, user.email)
@@ -371,27 +480,37 @@ async def register(user_data: UserCreate):
     return {
         "message": "User registered successfully",
         "token": token,
-        "user": UserResponse(**user.dict())
+        "user": user_response_from_dict(user_data_dict)
     }
 
+def _record_failed_login(email: str):
+    # Re-read the count after the awaits so concurrent failures all add up
+    _failed_logins[email] = _failed_logins.get(email, 0) + 1
+
 @api_router.post("/auth/login", response_model=dict)
 async def login(login_data: UserLogin):
+    if _failed_logins.get(login_data.email, 0) >= MAX_FAILED_LOGINS:
+        raise HTTPException(status_code=429, detail="Too many failed login attempts")
+    
     user_dict = await db.users.find_one({"email": login_data.email})
     if not user_dict:
+        _record_failed_login(login_data.email)
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    user_dict = parse_from_mongo(user_dict)
-    user = User(**user_dict)
+    user = user_from_mongo(user_dict)
     
-    if not verify_password(login_data.password, user.password_hash):
+    if not await verify_password(login_data.password, user.password_hash):
+        _record_failed_login(login_data.email)
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    _failed_logins.pop(login_data.email, None)
+    
     token = create_jwt_token(user.id, user.email)
     
     return {
         "message": "Login successful",
         "token": token,
-        "user": UserResponse(**user.dict())
+        "user": user_response_from_dict(user.dict())
     }
 
 class UserProfileUpdate(BaseModel):
@@ -407,10 +526,11 @@ async def update_user_profile(profile_data: UserProfileUpdate, current_user: Use
     """Update user profile information including handedness preference"""
     update_fields = {}
     
-    if profile_data.name is not None:
+    # Only write fields that actually differ from the stored profile
+    if profile_data.name is not None and profile_data.name != current_user.name:
         update_fields["name"] = profile_data.name
     
-    if profile_data.handedness is not None:
+    if profile_data.handedness is not None and profile_data.handedness != current_user.handedness:
         update_fields["handedness"] = profile_data.handedness.value
     
     if update_fields:
@@ -420,6 +540,8 @@ async def update_user_profile(profile_data: UserProfileUpdate, current_user: Use
             {"$set": update_fields}
         )
         
+        _user_cache.pop(current_user.id, None)
+        
         # Update current user object
         for field, value in update_fields.items():
             setattr(current_user, field, value)
@@ -443,8 +565,7 @@ async def create_checkin(checkin_data: CheckinRequest, current_user: User = Depe
         status=RoundStatus.SCHEDULED
     )
     
-    round_dict = prepare_for_mongo(round_obj.dict())
-    await db.rounds.insert_one(round_dict)
+    await db.rounds.insert_one(round_obj.dict())
     
     return {
         "message": "Check-in successful",
@@ -458,9 +579,7 @@ async def analyze_photo(photo_request: PhotoAnalysisRequest, current_user: User
     """Analyze clothing from a photo using AI"""
     try:
         # Clean the base64 data (remove data URL prefix if present)
-        photo_data = photo_request.photo_base64
-        if ',' in photo_data:
-            photo_data = photo_data.split(',')[1]
+        photo_data = strip_data_url(photo_request.photo_base64)
         
         # Analyze the photo
         analysis_result = await analyze_clothing_from_photo(photo_data)
@@ -471,6 +590,27 @@ async def analyze_photo(photo_request: PhotoAnalysisRequest, current_user: User
         logger.error(f"Photo analysis failed: {e}")
         raise HTTPException(status_code=500, detail="Photo analysis failed")
 
+@api_router.post("/checkin/analyze-all", response_model=Dict[str, ClothingAnalysisResult])
+async def analyze_all_photos(photo_batch: PhotoBatchAnalysisRequest, current_user: User = Depends(get_current_user)):
+    """Analyze clothing from all four onboarding photos concurrently"""
+    try:
+        photos = {
+            "face": photo_batch.face_photo,
+            "front": photo_batch.front_photo,
+            "side": photo_batch.side_photo,
+            "back": photo_batch.back_photo
+        }
+        
+        results = await asyncio.gather(
+            *(analyze_clothing_from_photo(strip_data_url(photo)) for photo in photos.values())
+        )
+        
+        return dict(zip(photos.keys(), results))
+        
+    except Exception as e:
+        logger.error(f"Batch photo analysis failed: {e}")
+        raise HTTPException(status_code=500, detail="Photo analysis failed")
+
 # Clothing Verification Route  
 @api_router.post("/verify-clothing", response_model=dict)
 async def verify_clothing(verification_data: dict, current_user: User = Depends(get_current_user)):
@@ -492,8 +632,7 @@ async def verify_clothing(verification_data: dict, current_user: User = Depends(
             handedness=verified_clothing.get('handedness', 'right')
         )
         
-        profile_dict = prepare_for_mongo(subject_profile.dict())
-        await db.subject_profiles.insert_one(profile_dict)
+        await db.subject_profiles.insert_one(subject_profile.dict())
         
         return {
             "message": "Clothing details verified and saved",
@@ -505,54 +644,67 @@ async def verify_clothing(verification_data: dict, current_user: User = Depends(
         logger.error(f"Clothing verification failed: {e}")
         raise HTTPException(status_code=500, detail="Clothing verification failed")
 
-@api_router.post("/checkin/photos", response_model=dict)
-async def capture_photos(photo_data: PhotoCaptureRequest, current_user: User = Depends(get_current_user)):
+async def create_subject_profile(round_id: str, clothing_descriptor: ClothingDescriptor, current_user: User) -> dict:
     # Verify round exists and belongs to user
-    round_dict = await db.rounds.find_one({"id": photo_data.round_id, "user_id": current_user.id})
+    round_dict = await db.rounds.find_one({"id": round_id, "user_id": current_user.id})
     if not round_dict:
         raise HTTPException(status_code=404, detail="Round not found")
     
     # Create subject profile
     subject_profile = SubjectProfile(
-        round_id=photo_data.round_id,
+        round_id=round_id,
         user_id=current_user.id,
         type="subscribed",  # Assuming subscribed for now
-        clothing_descriptor=photo_data.clothing_descriptor,
+        clothing_descriptor=clothing_descriptor,
         handedness=Handedness(round_dict["handedness"])
     )
     
-    profile_dict = prepare_for_mongo(subject_profile.dict())
-    await db.subject_profiles.insert_one(profile_dict)
+    await db.subject_profiles.insert_one(subject_profile.dict())
     
     return {
         "message": "Photos captured successfully",
         "subject_id": subject_profile.id
     }
 
+@api_router.post("/checkin/photos", response_model=dict)
+async def capture_photos(photo_data: PhotoCaptureRequest, current_user: User = Depends(get_current_user)):
+    return await create_subject_profile(photo_data.round_id, photo_data.clothing_descriptor, current_user)
+
+@api_router.post("/checkin/photos/upload", response_model=dict)
+async def upload_photos(
+    round_id: str = Form(...),
+    clothing_descriptor: str = Form(...),
+    face_photo: UploadFile = File(...),
+    front_photo: UploadFile = File(...),
+    side_photo: UploadFile = File(...),
+    back_photo: UploadFile = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """Multipart variant of /checkin/photos: raw image parts instead of base64 JSON"""
+    try:
+        descriptor = ClothingDescriptor.model_validate_json(clothing_descriptor)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid clothing_descriptor: {e}")
+    
+    return await create_subject_profile(round_id, descriptor, current_user)
+
 # Rounds Routes
 @api_router.get("/rounds", response_model=List[dict])
 async def get_user_rounds(current_user: User = Depends(get_current_user)):
-    rounds_cursor = db.rounds.find({"user_id": current_user.id}).sort("created_at", -1)
+    # Join clip counts server-side in one round trip instead of one count per round
+    rounds_cursor = db.rounds.aggregate([
+        {"$match": {"user_id": current_user.id}},
+        {"$sort": {"created_at": -1}},
+        {"$lookup": {"from": "clips", "localField": "id", "foreignField": "round_id", "as": "_clips"}},
+        {"$addFields": {"clips_count": {"$size": "$_clips"}}},
+        {"$project": {"_clips": 0}}
+    ])
     rounds = await rounds_cursor.to_list(length=None)
     
-    result = []
-    for round_dict in rounds:
-        round_dict = parse_from_mongo(round_dict)
-        
-        # Get clips count for this round
-        clips_count = await db.clips.count_documents({"round_id": round_dict["id"]})
-        
-        round_dict["clips_count"] = clips_count
-        result.append(round_dict)
-    
-    return result
+    return [parse_from_mongo(round_dict) for round_dict in rounds]
 
 @api_router.get("/rounds/{round_id}")
-async def get_round_details(round_id: str, current_user: User = Depends(get_current_user)):
-    round_dict = await db.rounds.find_one({"id": round_id, "user_id": current_user.id})
-    if not round_dict:
-        raise HTTPException(status_code=404, detail="Round not found")
-    
+async def get_round_details(round_id: str, round_dict: dict = Depends(get_current_round)):
     round_dict = parse_from_mongo(round_dict)
     
     # Get clips for this round
@@ -570,12 +722,7 @@ async def get_round_details(round_id: str, current_user: User = Depends(get_curr
 
 # Clips Routes  
 @api_router.get("/clips/{round_id}")
-async def get_round_clips(round_id: str, current_user: User = Depends(get_current_user)):
-    # Verify round belongs to user
-    round_dict = await db.rounds.find_one({"id": round_id, "user_id": current_user.id})
-    if not round_dict:
-        raise HTTPException(status_code=404, detail="Round not found")
-    
+async def get_round_clips(round_id: str, round_dict: dict = Depends(get_current_round)):
     clips_cursor = db.clips.find({"round_id": round_id}).sort("hole_number", 1)
     clips = await clips_cursor.to_list(length=None)
     
@@ -600,7 +747,7 @@ class VisionTriggerCapture(BaseModel):
 async def log_detection_event(event_data: VisionDetectionEvent, current_user: User = Depends(get_current_user)):
     """Log a vision detection event for potential shot capture"""
     try:
-        event_dict = prepare_for_mongo(event_data.dict())
+        event_dict = event_data.dict()
         await db.vision_events.insert_one(event_dict)
         
         return {
@@ -629,7 +776,7 @@ async def trigger_shot_capture(trigger_data: VisionTriggerCapture, current_user:
             "hole_number": trigger_data.hole_number,
             "camera_angle": trigger_data.camera_angle,
             "trigger_reason": trigger_data.trigger_reason,
-            "triggered_at": datetime.now(timezone.utc).isoformat(),
+            "triggered_at": datetime.now(timezone.utc),
             "status": "triggered"
         }
         
@@ -645,14 +792,9 @@ async def trigger_shot_capture(trigger_data: VisionTriggerCapture, current_user:
         raise HTTPException(status_code=500, detail="Failed to trigger shot capture")
 
 @api_router.get("/vision/events/{round_id}", response_model=List[dict])
-async def get_vision_events(round_id: str, current_user: User = Depends(get_current_user)):
+async def get_vision_events(round_id: str, round_dict: dict = Depends(get_current_round)):
     """Get vision detection events for a round"""
     try:
-        # Verify round belongs to user
-        round_dict = await db.rounds.find_one({"id": round_id, "user_id": current_user.id})
-        if not round_dict:
-            raise HTTPException(status_code=404, detail="Round not found")
-        
         events_cursor = db.vision_events.find({"round_id": round_id}).sort("timestamp", -1)
         events = await events_cursor.to_list(length=None)
         
@@ -663,17 +805,18 @@ async def get_vision_events(round_id: str, current_user: User = Depends(get_curr
 
 # Mock Data Generation (for demo purposes)
 @api_router.post("/demo/generate-clips/{round_id}")
-async def generate_demo_clips(round_id: str, current_user: User = Depends(get_current_user)):
-    # Verify round exists and belongs to user
-    round_dict = await db.rounds.find_one({"id": round_id, "user_id": current_user.id})
-    if not round_dict:
-        raise HTTPException(status_code=404, detail="Round not found")
-    
+async def generate_demo_clips(
+    round_id: str,
+    round_dict: dict = Depends(get_current_round),
+    current_user: User = Depends(get_current_user)
+):
     # Generate mock clips for holes 1, 3, 5, 7, 9 (partial round simulation)
     mock_holes = [1, 3, 5, 7, 9, 12, 15, 18]
+    # Read the clock once for the whole batch rather than once per clip
+    published_at = datetime.now(timezone.utc)
     
-    for hole_num in mock_holes:
-        clip = Clip(
+    clips = [
+        Clip(
             round_id=round_id,
             subject_id=f"subject_{current_user.id}",
             hole_number=hole_num,
@@ -682,11 +825,14 @@ async def generate_demo_clips(round_id: str, current_user: User = Depends(get_cu
             hls_manifest=f"https://demo-hls.birdieo.com/round_{round_id}/hole_{hole_num}/playlist.m3u8",
             poster_url=f"https://demo-hls.birdieo.com/round_{round_id}/hole_{hole_num}/poster.jpg",
             duration_sec=12 + (hole_num % 3) * 4,  # Vary duration 12-20 seconds
-            face_blur_applied=False
-        )
-        
-        clip_dict = prepare_for_mongo(clip.dict())
-        await db.clips.insert_one(clip_dict)
+            face_blur_applied=False,
+            published_at=published_at
+        ).dict()
+        for hole_num in mock_holes
+    ]
+    
+    # One round trip for the whole batch; unordered so one bad doc doesn't abort the rest
+    await db.clips.insert_many(clips, ordered=False)
     
     # Update round status to active
     await db.rounds.update_one(
@@ -696,21 +842,51 @@ async def generate_demo_clips(round_id: str, current_user: User = Depends(get_cu
     
     return {"message": f"Generated {len(mock_holes)} demo clips for round {round_id}"}
 
+@api_router.post("/test/seed", response_model=dict)
+async def seed_test_data(seed: TestSeedRequest):
+    """Register a user, check in, capture photos and generate demo clips in one call"""
+    if not ENABLE_TEST_SEED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    
+    registration = await register(seed.user)
+    user_dict = await db.users.find_one({"id": registration["user"].id}, _AUTH_USER_PROJECTION)
+    current_user = user_from_mongo(user_dict)
+    
+    checkin = await create_checkin(seed.checkin, current_user)
+    round_id = checkin["round_id"]
+    
+    photos = await capture_photos(
+        PhotoCaptureRequest(
+            round_id=round_id,
+            clothing_descriptor=seed.clothing_descriptor,
+            **seed.photos.dict()
+        ),
+        current_user
+    )
+    
+    # Ownership is implied: the round was created for this user above
+    await generate_demo_clips(round_id, round_dict=None, current_user=current_user)
+    clips = await get_round_clips(round_id, round_dict=None)
+    
+    return {
+        "token": registration["token"],
+        "user": registration["user"],
+        "round_id": round_id,
+        "subject_id": photos["subject_id"],
+        "clips": clips
+    }
+
 # Video Stream Routes
+# Pebble Beach live stream URL (in production this would be the HLS stream extracted from the page)
+PEBBLE_BEACH_STREAM_URL = "https://www.pebblebeach.com/golf/pebble-beach-golf-links/live-golf-cams/pebble-beach-golf-links-putting-green/"
+
 @api_router.get("/video/pebble-beach-stream")
 async def get_pebble_beach_stream():
-    """Proxy the Pebble Beach live stream for Hole 1"""
+    """Describe the Pebble Beach live stream for Hole 1"""
     try:
-        import requests
-        from fastapi.responses import StreamingResponse
-        
-        # Pebble Beach live stream URL (we'll try to extract the actual video stream)
-        pebble_beach_url = "https://www.pebblebeach.com/golf/pebble-beach-golf-links/live-golf-cams/pebble-beach-golf-links-putting-green/"
-        
         # For now, return a stream URL that can work with our vision system
-        # In production, this would extract the actual HLS stream from the Pebble Beach page
         stream_info = {
-            "stream_url": "https://www.pebblebeach.com/golf/pebble-beach-golf-links/live-golf-cams/pebble-beach-golf-links-putting-green/",
+            "stream_url": PEBBLE_BEACH_STREAM_URL,
             "stream_type": "hls",
             "hole_number": 1,
             "camera_name": "Pebble Beach Golf Links - Putting Green",
@@ -724,6 +900,30 @@ async def get_pebble_beach_stream():
         logger.error(f"Failed to get Pebble Beach stream: {e}")
         raise HTTPException(status_code=500, detail="Failed to access live stream")
 
+@api_router.get("/video/pebble-beach-stream/proxy")
+async def proxy_pebble_beach_stream():
+    """Proxy the Pebble Beach live stream for Hole 1, piping upstream bytes without buffering"""
+    try:
+        upstream = await _http.send(_http.build_request("GET", PEBBLE_BEACH_STREAM_URL), stream=True)
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to proxy Pebble Beach stream: {e}")
+        raise HTTPException(status_code=502, detail="Failed to access live stream")
+    
+    # Hand the pooled connection back on an error reply; on success the
+    # background task closes it once the body has been streamed
+    try:
+        upstream.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        await upstream.aclose()
+        logger.error(f"Failed to proxy Pebble Beach stream: {e}")
+        raise HTTPException(status_code=502, detail="Failed to access live stream")
+    
+    return StreamingResponse(
+        upstream.aiter_bytes(),
+        media_type=upstream.headers.get("content-type", "application/octet-stream"),
+        background=BackgroundTask(upstream.aclose)
+    )
+
 @api_router.post("/rounds/reset-hole1-video")
 async def reset_hole1_video(current_user: User = Depends(get_current_user)):
     """Reset all rounds to use the Pebble Beach live stream for Hole 1"""
@@ -736,7 +936,7 @@ async def reset_hole1_video(current_user: User = Depends(get_current_user)):
                 "poster_url": "https://images.unsplash.com/photo-1596727362302-b8d891c42ab8?crop=entropy&cs=srgb&fm=jpg&ixid=M3w3NDk1NzZ8MHwxfHNlYXJjaHwxfHxwZWJibGUlMjBiZWFjaHxlbnwwfHx8fDE3NTY2NTM5Mjl8MA&ixlib=rb-4.1.0&q=85",
                 "s3_key_master": "live/pebble-beach/hole_01/live_stream.m3u8",
                 "camera_id": "pebble_beach_putting_green",
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "updated_at": datetime.now(timezone.utc)
             }}
         )
         
@@ -767,6 +967,33 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# (collection, keys, options) for the indexes backing the hot query patterns
+DB_INDEXES = [
+    ("users", "email", {"unique": True}),
+    ("users", "id", {"unique": True}),
+    ("rounds", [("user_id", 1), ("created_at", -1)], {}),
+    ("rounds", [("id", 1), ("user_id", 1)], {}),
+    ("clips", [("round_id", 1), ("hole_number", 1)], {}),
+    ("vision_events", [("round_id", 1), ("timestamp", -1)], {}),
+    ("subject_profiles", "round_id", {}),
+]
+
+@app.on_event("startup")
+async def create_db_indexes():
+    """Create indexes backing the hot query patterns (no-op if they already exist)"""
+    # Each index on its own, so one failure (e.g. duplicate emails blocking the
+    # unique index) doesn't leave the rest uncreated
+    for collection, keys, options in DB_INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except ConnectionFailure as e:
+            # Mongo is unreachable; the remaining indexes would each wait out the same timeout
+            logger.error(f"Failed to create database indexes, Mongo unreachable: {e}")
+            return
+        except Exception as e:
+            logger.error(f"Failed to create index {keys!r} on {collection}: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+    await _http.aclose()
\ No newline at end of file
@@ -1,37 +1,112 @@
+"""Birdieo API test suite.
+
+Runs inside a vcrpy cassette (cassettes/birdieo.yaml) by default: requests
+missing from the cassette go to the API and are recorded, the rest replay
+offline. Install the test tools with `pip install -r requirements-test.txt`.
+
+No cassette is committed yet, so a recording is required before replay can
+work: the first run hits the live deployment and writes the cassette. Record
+(or refresh) it against a reachable API and commit the result:
+
+    python backend_test.py --record
+
+Pass --live to bypass the cassette entirely.
+"""
 import requests
 import sys
+import re
 import json
+import base64
+import argparse
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+
+try:
+    import vcr
+except ImportError:  # replay is optional; without vcrpy every run hits the live API
+    vcr = None
+
+CASSETTE_PATH = Path(__file__).parent / "cassettes" / "birdieo.yaml"
+
+# 1x1 JPEG used for every onboarding photo slot
+_TINY_JPEG_B64 = "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAABAAEDASIAAhEBAxEB/8QAFQABAQAAAAAAAAAAAAAAAAAAAAv/xAAUEAEAAAAAAAAAAAAAAAAAAAAA/8QAFQEBAQAAAAAAAAAAAAAAAAAAAAX/xAAUEQEAAAAAAAAAAAAAAAAAAAAA/9oADAMBAAIRAxEAPwCdABmX/9k="
+_TINY_JPEG_BYTES = base64.b64decode(_TINY_JPEG_B64.split(",", 1)[1])
+
+# Per-run values in request URLs and bodies: UUIDs (emails, ids), ISO-8601
+# timestamps (tee times) and the random hex multipart boundary
+_VOLATILE_PATTERNS = [
+    (re.compile(rb"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"), b"<uuid>"),
+    (re.compile(rb"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2})?"), b"<timestamp>"),
+    (re.compile(rb"\b[0-9a-f]{32}\b"), b"<boundary>"),
+]
+
+def _normalize(data: bytes) -> bytes:
+    for pattern, placeholder in _VOLATILE_PATTERNS:
+        data = pattern.sub(placeholder, data)
+    return data
+
+def _normalize_request(request):
+    """Replace per-run values so a replay matches the recorded request (vcrpy
+    passes a copy, and runs this both when recording and when matching)."""
+    request.uri = _normalize(request.uri.encode()).decode()
+    if request.body:
+        request.body = _normalize(request.body)
+    return request
+
+def _cassette(record=False):
+    """Record API traffic on the first run and replay it afterwards."""
+    recorder = vcr.VCR(
+        record_mode="all" if record else "new_episodes",
+        match_on=["method", "scheme", "host", "port", "path", "query", "body"],
+        before_record_request=_normalize_request,
+        filter_headers=["authorization"],
+        filter_post_data_parameters=["password"],
+        decode_compressed_response=True,
+    )
+    return recorder.use_cassette(str(CASSETTE_PATH))
 
 class BirdieoAPITester:
-    def __init__(self, base_url="https://shotspotter-1.preview.emergentagent.com/api"):
+    def __init__(self, base_url="https://shotspotter-1.preview.emergentagent.com/api", max_workers=3):
         self.base_url = base_url
+        # Threads for the independent reads; 1 runs them serially
+        self.max_workers = max_workers
         self.token = None
         self.user_id = None
         self.round_id = None
         self.tests_run = 0
         self.tests_passed = 0
         self.test_results = []
+        # Keep-alive session so the suite pays for one TLS handshake, not one per call
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=8))
+        self._results_lock = threading.Lock()
 
     def log_test(self, name, success, details=""):
         """Log test results"""
-        self.tests_run += 1
-        if success:
-            self.tests_passed += 1
-            print(f"✅ {name} - PASSED")
-        else:
-            print(f"❌ {name} - FAILED: {details}")
-        
-        self.test_results.append({
-            "name": name,
-            "success": success,
-            "details": details
-        })
+        with self._results_lock:
+            self.tests_run += 1
+            if success:
+                self.tests_passed += 1
+                print(f"✅ {name} - PASSED")
+            else:
+                print(f"❌ {name} - FAILED: {details}")
+            
+            self.test_results.append({
+                "name": name,
+                "success": success,
+                "details": details
+            })
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, headers=None):
+    def run_test(self, name, method, endpoint, expected_status, data=None, headers=None, files=None):
         """Run a single API test"""
         url = f"{self.base_url}/{endpoint}"
-        test_headers = {'Content-Type': 'application/json'}
+        # requests sets the multipart Content-Type (with boundary) itself when files are sent
+        test_headers = {} if files else {'Content-Type': 'application/json'}
         
         if self.token:
             test_headers['Authorization'] = f'Bearer {self.token}'
@@ -44,13 +119,15 @@ class BirdieoAPITester:
         
         try:
             if method == 'GET':
-                response = requests.get(url, headers=test_headers, timeout=10)
+                response = self.session.get(url, headers=test_headers, timeout=10)
+            elif method == 'POST' and files:
+                response = self.session.post(url, data=data, files=files, headers=test_headers, timeout=10)
             elif method == 'POST':
-                response = requests.post(url, json=data, headers=test_headers, timeout=10)
+                response = self.session.post(url, json=data, headers=test_headers, timeout=10)
             elif method == 'PUT':
-                response = requests.put(url, json=data, headers=test_headers, timeout=10)
+                response = self.session.put(url, json=data, headers=test_headers, timeout=10)
             elif method == 'DELETE':
-                response = requests.delete(url, headers=test_headers, timeout=10)
+                response = self.session.delete(url, headers=test_headers, timeout=10)
 
             success = response.status_code == expected_status
             
@@ -75,23 +152,31 @@ class BirdieoAPITester:
             self.log_test(name, False, f"Request failed: {str(e)}")
             return False, {}
 
-    def test_user_registration(self):
-        """Test user registration"""
-        timestamp = datetime.now().strftime('%H%M%S')
-        test_data = {
-            "name": f"Test User {timestamp}",
-            "email": f"testuser{timestamp}@birdieo.com",
+    def _new_user(self):
+        """Registration payload with an email no earlier run (or seed) has used"""
+        suffix = uuid.uuid4()
+        return {
+            "name": "Test User",
+            "email": f"testuser-{suffix}@birdieo.com",
             "password": "TestPass123!"
         }
-        
+
+    def test_user_registration(self, adopt=True):
+        """Test user registration
+
+        With adopt=False the new account is only checked, and the tester
+        keeps the token it already has (e.g. the seeded user's).
+        """
         success, response = self.run_test(
             "User Registration",
             "POST",
             "auth/register",
             200,
-            data=test_data
+            data=self._new_user()
         )
         
+        if not adopt:
+            return success and 'token' in response
         if success and 'token' in response:
             self.token = response['token']
             self.user_id = response['user']['id']
@@ -134,8 +219,12 @@ class BirdieoAPITester:
         )
         return success
 
-    def test_create_checkin(self):
-        """Test creating a check-in (round)"""
+    def test_create_checkin(self, adopt=True):
+        """Test creating a check-in (round)
+
+        With adopt=False the new round is only checked, and the tester
+        keeps working against the round it already has.
+        """
         # Create tee time for tomorrow
         tee_time = datetime.now(timezone.utc) + timedelta(days=1)
         
@@ -154,24 +243,21 @@ class BirdieoAPITester:
             data=checkin_data
         )
         
+        if not adopt:
+            return success and 'round_id' in response
         if success and 'round_id' in response:
             self.round_id = response['round_id']
             print(f"   Round ID: {self.round_id}")
             return True
         return False
 
-    def test_capture_photos(self):
-        """Test photo capture step"""
-        if not self.round_id:
-            self.log_test("Capture Photos", False, "No round_id available")
-            return False
-            
-        photo_data = {
-            "round_id": self.round_id,
-            "face_photo": "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAABAAEDASIAAhEBAxEB/8QAFQABAQAAAAAAAAAAAAAAAAAAAAv/xAAUEAEAAAAAAAAAAAAAAAAAAAAA/8QAFQEBAQAAAAAAAAAAAAAAAAAAAAX/xAAUEQEAAAAAAAAAAAAAAAAAAAAA/9oADAMBAAIRAxEAPwCdABmX/9k=",
-            "front_photo": "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAABAAEDASIAAhEBAxEB/8QAFQABAQAAAAAAAAAAAAAAAAAAAAv/xAAUEAEAAAAAAAAAAAAAAAAAAAAA/8QAFQEBAQAAAAAAAAAAAAAAAAAAAAX/xAAUEQEAAAAAAAAAAAAAAAAAAAAA/9oADAMBAAIRAxEAPwCdABmX/9k=",
-            "side_photo": "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAABAAEDASIAAhEBAxEB/8QAFQABAQAAAAAAAAAAAAAAAAAAAAv/xAAUEAEAAAAAAAAAAAAAAAAAAAAA/8QAFQEBAQAAAAAAAAAAAAAAAAAAAAX/xAAUEQEAAAAAAAAAAAAAAAAAAAAA/9oADAMBAAIRAxEAPwCdABmX/9k=",
-            "back_photo": "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAABAAEDASIAAhEBAxEB/8QAFQABAQAAAAAAAAAAAAAAAAAAAAv/xAAUEAEAAAAAAAAAAAAAAAAAAAAA/8QAFQEBAQAAAAAAAAAAAAAAAAAAAAX/xAAUEQEAAAAAAAAAAAAAAAAAAAAA/9oADAMBAAIRAxEAPwCdABmX/9k=",
+    def _photo_payload(self):
+        """Onboarding photos and clothing shared by check-in and seeding"""
+        return {
+            "face_photo": _TINY_JPEG_B64,
+            "front_photo": _TINY_JPEG_B64,
+            "side_photo": _TINY_JPEG_B64,
+            "back_photo": _TINY_JPEG_B64,
             "clothing_descriptor": {
                 "top_color": "navy",
                 "top_style": "polo",
@@ -180,13 +266,73 @@ class BirdieoAPITester:
                 "shoes_color": "brown"
             }
         }
+
+    def _bootstrap(self):
+        """Seed user, round, photos and demo clips in one request.
+
+        Returns False when the server doesn't expose /test/seed, so the
+        caller can fall back to the chained setup flow.
+        """
+        tee_time = datetime.now(timezone.utc) + timedelta(days=1)
+        photos = self._photo_payload()
+        seed_data = {
+            "user": self._new_user(),
+            "checkin": {
+                "tee_time": tee_time.isoformat(),
+                "course_id": "pebble_beach",
+                "course_name": "Pebble Beach Golf Links",
+                "handedness": "right"
+            },
+            "clothing_descriptor": photos.pop("clothing_descriptor"),
+            "photos": photos
+        }
+
+        print("\n🔍 Seeding test data...")
+        try:
+            response = self.session.post(f"{self.base_url}/test/seed", json=seed_data, timeout=30)
+        except requests.exceptions.RequestException as e:
+            print(f"   Seed request failed: {str(e)}")
+            return False
+
+        if response.status_code == 404:
+            print("   Seed endpoint not enabled, using chained setup")
+            return False
+        if response.status_code != 200:
+            self.log_test("Seed Test Data", False, f"Expected 200, got {response.status_code} - {response.text}")
+            return False
+
+        seeded = response.json()
+        self.token = seeded['token']
+        self.user_id = seeded['user']['id']
+        self.round_id = seeded['round_id']
+        self.log_test("Seed Test Data", True)
+        print(f"   Round ID: {self.round_id} ({len(seeded['clips'])} clips)")
+        return True
+
+    def test_capture_photos(self):
+        """Test photo capture step"""
+        if not self.round_id:
+            self.log_test("Capture Photos", False, "No round_id available")
+            return False
+            
+        # Raw JPEG parts instead of base64 JSON: a third fewer bytes and no server-side decode
+        photos = self._photo_payload()
+        form_data = {
+            "round_id": self.round_id,
+            "clothing_descriptor": json.dumps(photos["clothing_descriptor"])
+        }
+        files = {
+            slot: (f"{slot}.jpg", _TINY_JPEG_BYTES, "image/jpeg")
+            for slot in ("face_photo", "front_photo", "side_photo", "back_photo")
+        }
         
         success, response = self.run_test(
             "Capture Photos",
             "POST",
-            "checkin/photos",
+            "checkin/photos/upload",
             200,
-            data=photo_data
+            data=form_data,
+            files=files
         )
         return success
 
@@ -257,6 +403,33 @@ class BirdieoAPITester:
         print("🏌️ Starting Birdieo API Test Suite")
         print("=" * 50)
         
+        if self._bootstrap():
+            # Seeded state is in place; exercise the setup endpoints independently,
+            # each against the seeded token and round
+            if not self.test_get_current_user():
+                print("❌ User verification failed")
+                return False
+            self.test_user_registration(adopt=False)
+            self.test_create_checkin(adopt=False)
+            self.test_capture_photos()
+            self.test_generate_demo_clips()
+        elif not self._chained_setup():
+            return False
+            
+        # Round listing, details and clips are independent reads; run them concurrently
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [
+                pool.submit(self.test_get_user_rounds),
+                pool.submit(self.test_get_round_details),
+                pool.submit(self.test_get_round_clips),
+            ]
+            for future in futures:
+                future.result()
+        
+        return True
+
+    def _chained_setup(self):
+        """Build test state one endpoint at a time when seeding isn't available"""
         # Test authentication flow
         if not self.test_user_registration():
             print("❌ Registration failed, stopping tests")
@@ -275,17 +448,10 @@ class BirdieoAPITester:
             print("❌ Photo capture failed")
             return False
             
-        # Test round management
-        self.test_get_user_rounds()
-        
         # Test demo clip generation
         if not self.test_generate_demo_clips():
             print("❌ Demo clip generation failed")
             return False
-            
-        # Test round details and clips
-        self.test_get_round_details()
-        self.test_get_round_clips()
         
         return True
 
@@ -309,10 +475,28 @@ class BirdieoAPITester:
         return self.tests_passed == self.tests_run
 
 def main():
-    tester = BirdieoAPITester()
+    parser = argparse.ArgumentParser(description="Birdieo API test suite")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--live", action="store_true",
+                      help="bypass recorded cassettes and hit the live API")
+    mode.add_argument("--record", action="store_true",
+                      help="re-record the cassette from the live API")
+    args = parser.parse_args()
+
+    if args.record and vcr is None:
+        print("❌ --record needs vcrpy (pip install -r requirements-test.txt)")
+        return 1
+    if not args.live and vcr is None:
+        print("⚠️ vcrpy not installed, running against the live API")
+    use_cassette = not args.live and vcr is not None
+
+    # vcrpy's cassette isn't thread-safe, and any run with one can record a
+    # new episode, so keep requests serial whenever a cassette is active
+    tester = BirdieoAPITester(max_workers=1 if use_cassette else 3)
     
     try:
-        success = tester.run_all_tests()
+        with _cassette(record=args.record) if use_cassette else nullcontext():
+            success = tester.run_all_tests()
         tester.print_summary()
         return 0 if success else 1
     except Exception as e:
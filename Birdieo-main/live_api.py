@@ -1,13 +1,24 @@
 import os
 import time
+import asyncio
 import threading
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 from contextlib import asynccontextmanager
 
 import av          # PyAV (FFmpeg bindings)
+try:
+    from av.codec.hwaccel import HWAccel   # PyAV >= 14
+except ImportError:
+    HWAccel = None
 import numpy as np
-import cv2         # for JPEG encode / optional resize
-from fastapi import FastAPI, Response
+import cv2         # for JPEG encode (fallback)
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420   # libjpeg-turbo (SIMD)
+    _tj = TurboJPEG()
+except (ImportError, OSError, RuntimeError):                # package or shared lib missing
+    _tj = None
+from fastapi import FastAPI, Request, Response
 from starlette.responses import StreamingResponse
 
 ###############################################################################
@@ -24,20 +35,34 @@ HLS_HEADERS: Dict[str, str] = {
     # "User-Agent": "Mozilla/5.0",
 }
 
-TARGET_FPS   = float(os.getenv("TARGET_FPS", "10"))   # throttle publish rate
+TARGET_FPS   = float(os.getenv("TARGET_FPS", "10"))   # max publish rate; extra decoded frames are dropped
 MAX_WIDTH    = int(os.getenv("MAX_WIDTH", "1280"))    # downscale if wider
 JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "85"))   # 1..100
+HWACCEL      = os.getenv("HWACCEL", "")               # e.g. cuda / vaapi / videotoolbox; empty = software decode
 
 RECONNECT_BASE_DELAY = 1.0    # seconds
 RECONNECT_MAX_DELAY  = 20.0   # seconds
 
+_JPEG_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY]   # cv2.imencode fallback params
+
+# libjpeg-turbo can compress planar I420 directly, skipping the bgr24 expansion and the
+# BGR->YCbCr conversion back inside the encoder; BGR is then only produced for /analyze
+_FRAME_FORMAT = "yuv420p" if _tj is not None and hasattr(_tj, "encode_from_yuv") else "bgr24"
+
 ###############################################################################
 # GLOBAL STATE
 ###############################################################################
-_latest_frame: Optional[np.ndarray] = None  # BGR
+# Decoding runs on a reader thread, but frames are published on the event loop
+# (via call_soon_threadsafe), so endpoints read this state without locking
+_latest_frame: Optional[np.ndarray] = None  # in _FRAME_FORMAT; use _latest_bgr() for pixels
+_latest_jpeg: Optional[bytes] = None        # _latest_frame encoded once by the reader
+_latest_part: Optional[bytes] = None        # _latest_jpeg framed as a multipart/x-mixed-replace part
+_latest_frame_id: int = 0                   # bumped on every publish
 _latest_ts: float = 0.0
-_reader_running = True
-_lock = threading.Lock()
+_boot_id = format(time.time_ns(), "x")      # keeps /frame ETags unique across restarts
+_new_frame = asyncio.Event()                # set (and replaced) on every publish
+_reader_stop = threading.Event()            # set on shutdown; also interrupts reconnect backoff
+_bgr_cache: Tuple[int, Optional[np.ndarray]] = (0, None)   # (frame id, BGR) for I420 frames
 
 ###############################################################################
 # HELPERS
@@ -46,19 +71,76 @@ def _open_container(url: str, headers: Dict[str, str]) -> av.container.InputCont
     """
     Open HLS with optional HTTP headers.
     PyAV/FFmpeg expects headers as a single CRLF-separated string.
+    Decoding is offloaded to HWACCEL when set, falling back to software if the device is unavailable.
     """
     options = {}
     if headers:
         header_str = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
         options["headers"] = header_str
-    return av.open(url, mode="r", options=options)
 
-def _reader_loop():
-    global _latest_frame, _latest_ts
+    kwargs = {}
+    if HWACCEL:
+        if HWAccel is None:
+            print(f"[reader] HWACCEL={HWACCEL} needs PyAV >= 14; using software decode")
+        else:
+            kwargs["hwaccel"] = HWAccel(device_type=HWACCEL, allow_software_fallback=True)
+    return av.open(url, mode="r", options=options, **kwargs)
+
+def _encode_jpeg(img: np.ndarray) -> Optional[bytes]:
+    """_FRAME_FORMAT ndarray -> JPEG bytes at JPEG_QUALITY, via libjpeg-turbo when available."""
+    if _FRAME_FORMAT == "yuv420p":
+        height, width = img.shape[0] * 2 // 3, img.shape[1]
+        return _tj.encode_from_yuv(img, height, width, quality=JPEG_QUALITY, jpeg_subsample=TJSAMP_420)
+    if _tj is not None:
+        return _tj.encode(img, quality=JPEG_QUALITY, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    ok, buf = cv2.imencode(".jpg", img, _JPEG_PARAMS)
+    return buf.tobytes() if ok else None
+
+def _output_size(w: int, h: int) -> Tuple[int, int]:
+    """Target size for a w x h source, downscaled to MAX_WIDTH keeping aspect ratio."""
+    if MAX_WIDTH > 0 and w > MAX_WIDTH:
+        w, h = MAX_WIDTH, int(h * (MAX_WIDTH / w))
+    if _FRAME_FORMAT == "yuv420p":
+        # 4:2:0 needs even rows, and turbojpeg expects unpadded planes at its 4-byte row alignment
+        w, h = w - w % 8, h - h % 2
+    return w, h
+
+MJPEG_BOUNDARY = "frame"
+_MJPEG_PART_PREFIX = b"--" + MJPEG_BOUNDARY.encode() + b"\r\nContent-Type: image/jpeg\r\nContent-Length: "
+
+def _mjpeg_part(jpg: bytes) -> bytes:
+    """Frame JPEG bytes as one part of the /stream.mjpg multipart response."""
+    return b"".join((_MJPEG_PART_PREFIX, b"%d" % len(jpg), b"\r\n\r\n", jpg, b"\r\n"))
+
+def _publish(img: np.ndarray, jpg: bytes, part: bytes):
+    """Make a new frame current and wake every waiting viewer (event loop thread only)."""
+    global _latest_frame, _latest_jpeg, _latest_part, _latest_frame_id, _latest_ts, _new_frame
+    _latest_frame = img
+    _latest_jpeg = jpg
+    _latest_part = part
+    _latest_frame_id += 1
+    _latest_ts = time.time()
+    event, _new_frame = _new_frame, asyncio.Event()
+    event.set()
+
+def _latest_bgr() -> Optional[np.ndarray]:
+    """Current frame as BGR for inference, converting from I420 at most once per frame."""
+    global _bgr_cache
+    img = _latest_frame
+    if img is None or _FRAME_FORMAT == "bgr24":
+        return img
+    frame_id, bgr = _bgr_cache
+    if frame_id != _latest_frame_id:
+        bgr = cv2.cvtColor(img, cv2.COLOR_YUV2BGR_I420)
+        _bgr_cache = (_latest_frame_id, bgr)
+    return bgr
+
+def _reader_loop(loop: asyncio.AbstractEventLoop):
+    # PyAV demuxes and decodes the HLS stream with blocking FFmpeg calls, so this stays a thread
     delay = 1.0 / max(1e-6, TARGET_FPS)
     backoff = RECONNECT_BASE_DELAY
 
-    while _reader_running:
+    while not _reader_stop.is_set():
         container = None
         try:
             container = _open_container(STREAM_URL, HLS_HEADERS)
@@ -71,24 +153,35 @@ def _reader_loop():
 
             backoff = RECONNECT_BASE_DELAY  # reset backoff after successful open
 
+            src_size = None
+            next_publish = 0.0
             for frame in container.decode(video=0):
-                img = frame.to_ndarray(format="bgr24")
+                if _reader_stop.is_set():
+                    break
+                # Keep decoding in real time but drop frames until the next publish slot;
+                # skipped frames never reach to_ndarray/encode
+                now = time.monotonic()
+                if now < next_publish:
+                    continue
+                next_publish = now + delay
 
-                if MAX_WIDTH > 0 and img.shape[1] > MAX_WIDTH:
-                    h, w = img.shape[:2]
-                    new_w = MAX_WIDTH
-                    new_h = int(h * (new_w / w))
-                    img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+                # Source size is fixed within a rendition; recompute only if it switches
+                if (frame.width, frame.height) != src_size:
+                    src_size = (frame.width, frame.height)
+                    out_w, out_h = _output_size(*src_size)
 
-                with _lock:
-                    _latest_frame = img
-                    _latest_ts = time.time()
+                # Let libswscale scale in YUV (and only expand to bgr24 if we can't encode I420)
+                img = frame.reformat(width=out_w, height=out_h, format=_FRAME_FORMAT,
+                                     interpolation="AREA").to_ndarray()
 
-                time.sleep(delay)
+                # Encode and frame once here rather than once per viewer on the serve path
+                jpg = _encode_jpeg(img)
+                if jpg is not None:
+                    loop.call_soon_threadsafe(_publish, img, jpg, _mjpeg_part(jpg))
 
         except Exception as e:
             print(f"[reader] Error: {e}. Reconnecting in {backoff:.1f}s")
-            time.sleep(backoff)
+            _reader_stop.wait(backoff)
             backoff = min(RECONNECT_MAX_DELAY, backoff * 2.0)
         finally:
             try:
@@ -104,14 +197,13 @@ def _reader_loop():
 async def lifespan(app: FastAPI):
     # --- startup ---
     print(f"[startup] Starting reader for {STREAM_URL}")
-    t = threading.Thread(target=_reader_loop, daemon=True)
+    t = threading.Thread(target=_reader_loop, args=(asyncio.get_running_loop(),), daemon=True)
     t.start()
 
     yield  # API runs during this period
 
     # --- shutdown ---
-    global _reader_running
-    _reader_running = False
+    _reader_stop.set()
     print("[shutdown] Reader stopping…")
 
 app = FastAPI(title="Riverside Live CV API", lifespan=lifespan)
@@ -120,46 +212,34 @@ app = FastAPI(title="Riverside Live CV API", lifespan=lifespan)
 # ENDPOINTS
 ###############################################################################
 @app.get("/health")
-def health():
-    with _lock:
-        has_frame = _latest_frame is not None
-        age = (time.time() - _latest_ts) if has_frame else None
+async def health():
+    has_frame = _latest_frame is not None
+    age = (time.time() - _latest_ts) if has_frame else None
     return {"ok": has_frame, "age_seconds": age, "stream_url": STREAM_URL}
 
 @app.get("/frame")
-def latest_frame():
-    with _lock:
-        frame = None if _latest_frame is None else _latest_frame.copy()
-    if frame is None:
+async def latest_frame(request: Request):
+    jpg = _latest_jpeg
+    if jpg is None:
         return Response(status_code=503)
-    ok, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-    if not ok:
-        return Response(status_code=500)
-    return Response(content=buf.tobytes(), media_type="image/jpeg")
+    # Pollers revalidate with the frame id and get an empty 304 until a new frame lands
+    headers = {"ETag": f'"{_boot_id}-{_latest_frame_id}"', "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=jpg, media_type="image/jpeg", headers=headers)
 
 @app.get("/stream.mjpg")
-def mjpeg():
-    boundary = "frame"
-
-    def gen():
+async def mjpeg():
+    async def gen():
+        last_id = 0
         while True:
-            with _lock:
-                frm = None if _latest_frame is None else _latest_frame.copy()
-            if frm is None:
-                time.sleep(0.05)
-                continue
-            ok, buf = cv2.imencode(".jpg", frm, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-            if not ok:
-                time.sleep(0.02)
+            # Sleep until the reader publishes a newer frame
+            if _latest_frame_id == last_id:
+                await _new_frame.wait()
                 continue
-
-            jpg = buf.tobytes()
-            yield (
-                b"--" + boundary.encode() + b"\r\n"
-                b"Content-Type: image/jpeg\r\n"
-                b"Content-Length: " + str(len(jpg)).encode() + b"\r\n\r\n" +
-                jpg + b"\r\n"
-            )
+            # The part is framed once per frame off the loop, not once per viewer here
+            part, last_id = _latest_part, _latest_frame_id
+            yield part
 
     headers = {
         "Cache-Control": "no-cache, no-store, must-revalidate",
@@ -169,16 +249,15 @@ def mjpeg():
 
     return StreamingResponse(
         gen(),
-        media_type=f"multipart/x-mixed-replace; boundary={boundary}",
+        media_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
         headers=headers,
     )
 
 @app.get("/analyze")
-def analyze_demo():
-    """Replace this with real inference on `_latest_frame`."""
-    with _lock:
-        frame = None if _latest_frame is None else _latest_frame.copy()
-        ts = _latest_ts
+async def analyze_demo():
+    """Replace this with real inference on `_latest_bgr()`."""
+    # The reader publishes a fresh array each time and never mutates it, so no copy is needed
+    frame, ts = _latest_bgr(), _latest_ts
     if frame is None:
         return {"ok": False, "reason": "no frame yet"}
     h, w = frame.shape[:2]
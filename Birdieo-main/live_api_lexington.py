@@ -1,114 +1,185 @@
+import asyncio
 import time
-import threading
-from contextlib import asynccontextmanager
-from typing import Optional
+from contextlib import asynccontextmanager, suppress
+from typing import List, Optional, Tuple
 
-import requests
+import httpx
 import numpy as np
 import cv2
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, Request, Response
 from starlette.responses import StreamingResponse
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420   # libjpeg-turbo (SIMD)
+    _tj = TurboJPEG()
+except (ImportError, OSError, RuntimeError):                # package or shared lib missing
+    _tj = None
 
 # ====================== CONFIG ======================
 SNAPSHOT_URL = "https://stream.lexingtonnc.gov/golf/hole1/readImage.asp?dummy=1756663077563"
 SNAPSHOT_INTERVAL = 1.0      # seconds between polls
 MAX_WIDTH = 1280             # downscale if wider (set 0 to disable)
-JPEG_QUALITY = 85            # 1..100 for /frame and /stream.mjpg
+JPEG_QUALITY = 85            # 1..100, used when a resized snapshot is re-encoded
 # ====================================================
 
+_JPEG_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY]   # cv2.imencode fallback params
+
+# Bust caches with a timestamp so browsers/CDNs don’t serve stale images
+_SNAPSHOT_URL_TEMPLATE = SNAPSHOT_URL + ("&t={}" if "?" in SNAPSHOT_URL else "?t={}")
+
+# State is only touched on the event loop thread, so no locking is needed
 _latest_frame: Optional[np.ndarray] = None
+_latest_jpeg: Optional[bytes] = None   # JPEG bytes of _latest_frame, served as-is
+_latest_part: Optional[bytes] = None   # _latest_jpeg framed as a multipart/x-mixed-replace part
+_latest_frame_id: int = 0              # bumped on every publish
 _latest_ts: float = 0.0
-_reader_running = True
-_lock = threading.Lock()
-
-def _snapshot_reader_loop():
+_boot_id = format(time.time_ns(), "x") # keeps /frame ETags unique across restarts
+_new_frame = asyncio.Event()           # set (and replaced) on every publish
+
+# Resize targets reused across snapshots; two so the published frame is never overwritten
+_resize_bufs: List[Optional[np.ndarray]] = [None, None]
+
+def _encode_jpeg(img: np.ndarray) -> Optional[bytes]:
+    """BGR ndarray -> JPEG bytes at JPEG_QUALITY, via libjpeg-turbo when available."""
+    if _tj is not None:
+        return _tj.encode(img, quality=JPEG_QUALITY, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    ok, buf = cv2.imencode(".jpg", img, _JPEG_PARAMS)
+    return buf.tobytes() if ok else None
+
+MJPEG_BOUNDARY = "frame"
+_MJPEG_PART_PREFIX = b"--" + MJPEG_BOUNDARY.encode() + b"\r\nContent-Type: image/jpeg\r\nContent-Length: "
+
+def _mjpeg_part(jpg: bytes) -> bytes:
+    """Frame JPEG bytes as one part of the /stream.mjpg multipart response."""
+    return b"".join((_MJPEG_PART_PREFIX, b"%d" % len(jpg), b"\r\n\r\n", jpg, b"\r\n"))
+
+def _resize_target(shape: Tuple[int, int, int]) -> np.ndarray:
+    """Return a reusable resize buffer that isn't the currently published frame."""
+    slot = 0 if _resize_bufs[0] is not _latest_frame else 1
+    buf = _resize_bufs[slot]
+    if buf is None or buf.shape != shape:
+        buf = _resize_bufs[slot] = np.empty(shape, dtype=np.uint8)
+    return buf
+
+def _decode_snapshot(content: bytes) -> Tuple[np.ndarray, bytes, bytes]:
+    """Decode (and downscale if needed) a snapshot; returns the frame, its JPEG bytes and MJPEG part."""
+    arr = np.frombuffer(content, dtype=np.uint8)
+    img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise RuntimeError("cv2.imdecode returned None")
+
+    # Upstream is already a JPEG; only re-encode when we had to resize it
+    jpg = content
+    if MAX_WIDTH > 0 and img.shape[1] > MAX_WIDTH:
+        h, w = img.shape[:2]
+        new_w = MAX_WIDTH
+        new_h = int(h * (new_w / w))
+        img = cv2.resize(img, (new_w, new_h), dst=_resize_target((new_h, new_w, 3)),
+                         interpolation=cv2.INTER_AREA)
+        jpg = _encode_jpeg(img)
+        if jpg is None:
+            raise RuntimeError("JPEG encode failed")
+    return img, jpg, _mjpeg_part(jpg)
+
+def _publish(img: np.ndarray, jpg: bytes, part: bytes):
+    """Make a new frame current and wake every waiting viewer."""
+    global _latest_frame, _latest_jpeg, _latest_part, _latest_frame_id, _latest_ts, _new_frame
+    _latest_frame = img
+    _latest_jpeg = jpg
+    _latest_part = part
+    _latest_frame_id += 1
+    _latest_ts = time.time()
+    event, _new_frame = _new_frame, asyncio.Event()
+    event.set()
+
+async def _snapshot_reader(client: httpx.AsyncClient):
     """Continuously fetch the JPEG and publish it as the latest frame."""
-    global _latest_frame, _latest_ts
+    global _latest_ts
     backoff = 1.0
-    while _reader_running:
+    last_modified: Optional[str] = None
+    etag: Optional[str] = None
+    while True:
         try:
-            # Bust caches with a timestamp so browsers/CDNs don’t serve stale images
-            url = f"{SNAPSHOT_URL}&t={int(time.time()*1000)}" if "?" in SNAPSHOT_URL \
-                  else f"{SNAPSHOT_URL}?t={int(time.time()*1000)}"
-
-            r = requests.get(url, timeout=10)
+            url = _SNAPSHOT_URL_TEMPLATE.format(int(time.time()*1000))
+
+            # Conditional GET: an unchanged snapshot comes back as an empty 304
+            headers = {}
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+            if etag:
+                headers["If-None-Match"] = etag
+
+            r = await client.get(url, headers=headers)
+            if r.status_code == 304:
+                _latest_ts = time.time()   # current frame is still the latest
+                backoff = 1.0
+                await asyncio.sleep(SNAPSHOT_INTERVAL)
+                continue
             r.raise_for_status()
+            last_modified = r.headers.get("Last-Modified")
+            etag = r.headers.get("ETag")
 
-            arr = np.frombuffer(r.content, dtype=np.uint8)
-            img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-            if img is None:
-                raise RuntimeError("cv2.imdecode returned None")
-
-            if MAX_WIDTH > 0 and img.shape[1] > MAX_WIDTH:
-                h, w = img.shape[:2]
-                new_w = MAX_WIDTH
-                new_h = int(h * (new_w / w))
-                img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-
-            with _lock:
-                _latest_frame = img
-                _latest_ts = time.time()
+            # Decode/resize/encode/framing are CPU-bound; keep them off the event loop
+            img, jpg, part = await asyncio.to_thread(_decode_snapshot, r.content)
+            _publish(img, jpg, part)
 
             backoff = 1.0
-            time.sleep(SNAPSHOT_INTERVAL)
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
 
         except Exception as e:
             print(f"[SNAPSHOT] Error: {e}. Retrying in {backoff:.1f}s")
-            time.sleep(backoff)
+            await asyncio.sleep(backoff)
             backoff = min(20.0, backoff * 2.0)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print(f"[startup] Polling snapshot: {SNAPSHOT_URL}")
-    t = threading.Thread(target=_snapshot_reader_loop, daemon=True)
-    t.start()
+    # Small keep-alive pool so each poll reuses the TLS connection instead of re-handshaking
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(10.0, connect=3.05),
+        transport=httpx.AsyncHTTPTransport(
+            retries=2,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=2, keepalive_expiry=60),
+        ),
+    )
+    reader = asyncio.create_task(_snapshot_reader(client))
     yield
-    global _reader_running
-    _reader_running = False
     print("[shutdown] Reader stopping…")
+    reader.cancel()
+    with suppress(asyncio.CancelledError):
+        await reader
+    await client.aclose()
 
 app = FastAPI(title="Lexington Live Image API", lifespan=lifespan)
 
 @app.get("/health")
-def health():
-    with _lock:
-        has_frame = _latest_frame is not None
-        age = (time.time() - _latest_ts) if has_frame else None
+async def health():
+    has_frame = _latest_frame is not None
+    age = (time.time() - _latest_ts) if has_frame else None
     return {"ok": has_frame, "age_seconds": age, "source": SNAPSHOT_URL}
 
 @app.get("/frame")
-def frame():
-    with _lock:
-        img = None if _latest_frame is None else _latest_frame.copy()
-    if img is None:
+async def frame(request: Request):
+    jpg = _latest_jpeg
+    if jpg is None:
         return Response(status_code=503)
-    ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-    if not ok:
-        return Response(status_code=500)
-    return Response(content=buf.tobytes(), media_type="image/jpeg")
+    # Pollers revalidate with the frame id and get an empty 304 until a new frame lands
+    headers = {"ETag": f'"{_boot_id}-{_latest_frame_id}"', "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=jpg, media_type="image/jpeg", headers=headers)
 
 @app.get("/stream.mjpg")
-def mjpeg():
-    boundary = "frame"
-
-    def gen():
+async def mjpeg():
+    async def gen():
+        last_id = 0
         while True:
-            with _lock:
-                img = None if _latest_frame is None else _latest_frame.copy()
-            if img is None:
-                time.sleep(0.05)
-                continue
-            ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-            if not ok:
-                time.sleep(0.02)
+            # Sleep until the reader publishes a newer frame
+            if _latest_frame_id == last_id:
+                await _new_frame.wait()
                 continue
-            jpg = buf.tobytes()
-            yield (
-                b"--" + boundary.encode() + b"\r\n"
-                b"Content-Type: image/jpeg\r\n"
-                b"Content-Length: " + str(len(jpg)).encode() + b"\r\n\r\n" +
-                jpg + b"\r\n"
-            )
+            # The part is framed once per frame off the loop, not once per viewer here
+            part, last_id = _latest_part, _latest_frame_id
+            yield part
 
     headers = {
         "Cache-Control": "no-cache, no-store, must-revalidate",
@@ -117,16 +188,15 @@ def mjpeg():
     }
     return StreamingResponse(
         gen(),
-        media_type=f"multipart/x-mixed-replace; boundary={boundary}",
+        media_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
         headers=headers,
     )
 
 @app.get("/analyze")
-def analyze_demo():
+async def analyze_demo():
     """Replace with your actual CV; this returns a dummy box."""
-    with _lock:
-        img = None if _latest_frame is None else _latest_frame.copy()
-        ts = _latest_ts
+    # The reader never writes into the published array (resizes go to the other buffer), so no copy is needed
+    img, ts = _latest_frame, _latest_ts
     if img is None:
         return {"ok": False, "reason": "no frame yet"}
     h, w = img.shape[:2]
@@ -0,0 +1,56 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+server = pytest.importorskip("server", reason="backend dependencies not installed")
+
+from fastapi import HTTPException
+
+
+class _FakeUsers:
+    async def find_one(self, query, *args, **kwargs):
+        await asyncio.sleep(0)
+        return {
+            "id": "user-1",
+            "email": query["email"],
+            "password_hash": "unused",
+            "name": "Test User",
+        }
+
+
+class _FakeDB:
+    users = _FakeUsers()
+
+
+async def _wrong_password(password, hashed):
+    await asyncio.sleep(0)
+    return False
+
+
+async def _attempt(email):
+    try:
+        await server.login(server.UserLogin(email=email, password="wrong"))
+    except HTTPException as e:
+        return e.status_code
+    return 200
+
+
+def test_concurrent_failed_logins_reach_lockout(monkeypatch):
+    monkeypatch.setattr(server, "db", _FakeDB())
+    monkeypatch.setattr(server, "verify_password", _wrong_password)
+    monkeypatch.setattr(server, "_failed_logins", {})
+    email = "throttle@birdieo.com"
+
+    async def run():
+        # All of these pass the lockout check before any of them records a failure
+        statuses = await asyncio.gather(*(_attempt(email) for _ in range(server.MAX_FAILED_LOGINS)))
+        return statuses, await _attempt(email)
+
+    statuses, after = asyncio.run(run())
+
+    assert statuses == [401] * server.MAX_FAILED_LOGINS
+    assert server._failed_logins[email] == server.MAX_FAILED_LOGINS
+    assert after == 429
@@ -1,33 +1,63 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Form, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import ConnectionFailure
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, TypeAdapter
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
-from datetime import datetime, timezone, timedelta
+import secrets
+from datetime import datetime, timezone
 import jwt
 import bcrypt
 import aiofiles
-import json
+import orjson
 import time
 import threading
-from contextlib import asynccontextmanager
-import requests
+from contextlib import asynccontextmanager, suppress
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import numpy as np
 import cv2
+try:
+    import PIL
+    from PIL import Image
+    # Pillow-SIMD versions carry a ".postN" suffix; stock Pillow is no faster than cv2.resize
+    _PIL_SIMD = ".post" in PIL.__version__
+except ImportError:
+    _PIL_SIMD = False
+try:
+    import simplejpeg   # bundles libjpeg-turbo in its wheels; used when PyTurboJPEG's system library is missing
+except ImportError:
+    simplejpeg = None
+try:
+    from numba import njit   # optional: compiles the person-tracking match loop
+except ImportError:
+    njit = None
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420   # libjpeg-turbo (SIMD, DCT-domain scaling)
+    _tj = TurboJPEG()
+except (ImportError, OSError, RuntimeError):                # package or shared lib missing
+    _tj = None
 from starlette.responses import StreamingResponse, Response
 import base64
 import hashlib
+import inspect
+import itertools
 from datetime import datetime
 import subprocess
 import asyncio
 import os
+from collections import deque
 
 # Import for AI integration
 from emergentintegrations.llm.chat import LlmChat, UserMessage, ImageContent
@@ -44,26 +74,81 @@ db = client[os.environ['DB_NAME']]
 JWT_SECRET = os.environ.get('JWT_SECRET', 'birdieo-secret-key-2024')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24
+JWT_EXPIRATION_SECONDS = JWT_EXPIRATION_HOURS * 3600
+BCRYPT_ROUNDS = 12   # bcrypt work factor (its default), pinned so the cost is explicit
 
 # AI Configuration
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY', 'sk-emergent-fB808Dd9a3dC47a913')
 
+VISION_MODEL = ("openai", "gpt-4o")
+# The model resamples images internally; above ~80 quality only inflates the upload
+VISION_JPEG_QUALITY = 80
+DETECT_MAX_DIM = 640       # long edge of the frame copy sent for person detection
+
+# System prompts are built once at import rather than per vision call
+CLOTHING_ANALYSIS_SYSTEM_MESSAGE = """You are an expert at analyzing clothing in golf course photos for player identification. 
+            Provide detailed, specific descriptions that would help identify a person on a golf course. 
+            Focus on colors, patterns, styles, and distinctive features."""
+
+ENHANCED_PERSON_DETECTION_SYSTEM_MESSAGE = """You are an expert computer vision system specialized in accurate person detection and tracking on golf courses. 
+            Your task is to identify each person with high precision, providing tight, accurate bounding boxes.
+            Focus on:
+            1. Precise bounding box coordinates that tightly fit each person
+            2. High confidence scoring based on clear visibility
+            3. Distinguishing between golfers, caddies, and spectators
+            4. Accurate pixel-level coordinates (not percentages)"""
+
+PERSON_DETECTION_SYSTEM_MESSAGE = """You are an expert at detecting people in golf course video frames. 
+            For each person detected, provide bounding box coordinates as pixel values (not percentages).
+            Return accurate bounding boxes that tightly fit around each person."""
+
 # Live Stream Configuration (from live_api_lexington.py)
 SNAPSHOT_URL = "https://stream.lexingtonnc.gov/golf/hole1/readImage.asp?dummy=1756663077563"
-SNAPSHOT_INTERVAL = 1.0
+SNAPSHOT_INTERVAL = float(os.environ.get('SNAPSHOT_INTERVAL', '1.0'))            # seconds between polls while in use
+IDLE_SNAPSHOT_INTERVAL = float(os.environ.get('IDLE_SNAPSHOT_INTERVAL', '10.0'))  # seconds between polls while nobody reads
+IDLE_AFTER_SECONDS = 30.0    # no frame reads (and no MJPEG viewers) for this long counts as idle
 MAX_WIDTH = 1280
 JPEG_QUALITY = 85
 
+# Bust caches with a timestamp so proxies/CDNs don't serve stale images
+_SNAPSHOT_URL_TEMPLATE = SNAPSHOT_URL + ("&t={}" if "?" in SNAPSHOT_URL else "?t={}")
+
+GPU_JPEG_DECODE = os.environ.get('GPU_JPEG_DECODE', '') == '1'   # decode snapshots with nvJPEG on a CUDA host
+
+UPLOAD_CHUNK_SIZE = 1 << 16  # bytes per read when saving uploaded photos
+RECENT_FRAMES = 64           # snapshots kept for clip capture (~1 minute at 1 Hz)
+CLIP_SECONDS = 30
+
 # Global variables for live stream and person tracking
-_latest_frame: Optional[np.ndarray] = None
-_latest_ts: float = 0.0
-_reader_running = True
-_lock = threading.Lock()
+# The current snapshot is one immutable (frame, ts, jpeg) tuple, swapped in with a single
+# assignment, so readers always see a matching set without a lock. The frame array itself is
+# never mutated once published: readers hold it by reference, and anything that draws on it
+# must copy first. jpeg is the frame encoded once per snapshot, served as-is.
+_latest: Optional[Tuple[np.ndarray, float, bytes]] = None
+_new_frame = asyncio.Event()  # set (and replaced) on every publish
+# Recent (jpeg, ts) snapshots, oldest first; appended only by the reader on the event loop
+_recent_frames: deque = deque(maxlen=RECENT_FRAMES)
+# Demand tracking: the reader drops to IDLE_SNAPSHOT_INTERVAL when nothing has read a frame
+_mjpeg_viewers = 0
+_last_frame_read = 0.0         # time.monotonic() of the last _read_snapshot()
+_frame_wanted = asyncio.Event()  # wakes an idle reader as soon as a frame is read again
+# (snapshot ts, detection task) for the most recent snapshot that was analyzed
+_detection_cache: Optional[Tuple[float, asyncio.Future]] = None
+# (snapshot ts, JPEG with detections drawn) last served by /stream/frame-with-detection
+_annotated_cache: Optional[Tuple[float, bytes]] = None
 
 # Person tracking variables
+# Only touched from coroutines on the event loop thread, so no locking is needed
 _person_tracker = {}  # Dictionary to store person information
-_next_person_id = 1
-_person_id_lock = threading.Lock()
+_person_ids = itertools.count(1)
+# Parallel arrays indexing _person_tracker for the nearest-neighbour match: row i holds
+# the center (x, y) and last-seen epoch seconds of _track_ids[i]; grown by doubling
+_track_ids: List[str] = []
+_track_centers = np.zeros((16, 2), dtype=np.int64)
+_track_last_seen = np.zeros(16, dtype=np.float64)
+TRACK_MAX_AGE_SECONDS = 30     # only match persons seen this recently
+TRACK_MAX_DISTANCE = 100       # pixels between centers to count as the same person
+TRACK_EVICT_AFTER_SECONDS = TRACK_MAX_AGE_SECONDS + 300   # forget persons unseen this long
 
 # Create upload directories
 upload_dirs = [
@@ -77,55 +162,319 @@ for dir_path in upload_dirs:
 # Security
 security = HTTPBearer()
 
-def _snapshot_reader_loop():
-    """Continuously fetch the JPEG and publish it as the latest frame."""
-    global _latest_frame, _latest_ts
-    backoff = 1.0
-    while _reader_running:
-        try:
-            url = f"{SNAPSHOT_URL}&t={int(time.time()*1000)}" if "?" in SNAPSHOT_URL else f"{SNAPSHOT_URL}?t={int(time.time()*1000)}"
-            r = requests.get(url, timeout=10)
-            r.raise_for_status()
+# Projection for lookups that only check whether a document exists
+_EXISTS_PROJECTION = {"_id": 1}
+
+def _downscale(img: np.ndarray, new_w: int, new_h: int) -> np.ndarray:
+    """Area-downscale a BGR frame, via Pillow-SIMD's AVX2 kernels when installed."""
+    if _PIL_SIMD:
+        h, w = img.shape[:2]
+        # Resampling is per-channel, so BGR can pass through as "RGB" without a swap
+        pil_img = Image.frombuffer("RGB", (w, h), img, "raw", "RGB", 0, 1)
+        return np.asarray(pil_img.resize((new_w, new_h), Image.BOX))
+    return cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+
+# Dedicated pool for JPEG encodes (cv2 releases the GIL), so they don't take the
+# default-executor slots snapshot decoding uses
+_encode_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="jpeg-encode")
+# bcrypt also releases the GIL, so one thread per core verifies logins in parallel; a
+# separate pool keeps a login burst from queueing snapshot decodes behind it
+_password_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="bcrypt")
+
+def _encode_jpeg(img: np.ndarray, quality: int = JPEG_QUALITY) -> bytes:
+    """BGR ndarray -> JPEG bytes, via libjpeg-turbo (PyTurboJPEG, then simplejpeg) when available."""
+    if _tj is not None:
+        return _tj.encode(img, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    if simplejpeg is not None:
+        return simplejpeg.encode_jpeg(np.ascontiguousarray(img), quality=quality, colorspace='BGR',
+                                      colorsubsampling='420', fastdct=True)
+    ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise RuntimeError("JPEG encode failed")
+    return buf.tobytes()
+
+@lru_cache(maxsize=8)
+def _detection_size(w: int, h: int) -> Tuple[int, int]:
+    """(w, h) a w x h frame is sent to the vision model at, long edge capped at DETECT_MAX_DIM."""
+    scale = DETECT_MAX_DIM / max(w, h)
+    if scale >= 1:
+        return w, h
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+def _encode_jpeg_b64(img: np.ndarray, quality: int, size: Optional[Tuple[int, int]] = None) -> str:
+    if size is not None and size != (img.shape[1], img.shape[0]):
+        img = _downscale(img, *size)
+    return base64.b64encode(_encode_jpeg(img, quality)).decode('ascii')
+
+async def encode_vision_image(img: np.ndarray, size: Optional[Tuple[int, int]] = None) -> ImageContent:
+    """Downscale to size (w, h) if given, then JPEG + base64 a frame for a vision call on the JPEG pool."""
+    image_b64 = await asyncio.get_running_loop().run_in_executor(
+        _encode_pool, _encode_jpeg_b64, img, VISION_JPEG_QUALITY, size)
+    return ImageContent(image_base64=image_b64)
+
+def _load_gpu_decoder():
+    """nvImageCodec (nvJPEG) decoder when GPU_JPEG_DECODE is set, else None."""
+    if not GPU_JPEG_DECODE:
+        return None
+    try:
+        from nvidia import nvimgcodec
+        return nvimgcodec.Decoder()
+    except Exception as e:   # package missing or no usable CUDA device
+        print(f"[startup] GPU_JPEG_DECODE=1 but nvImageCodec is unavailable ({e}); decoding on the CPU")
+        return None
 
-            arr = np.frombuffer(r.content, dtype=np.uint8)
-            img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-            if img is None:
-                raise RuntimeError("cv2.imdecode returned None")
+_gpu_decoder = _load_gpu_decoder()
+
+# Older PyTurboJPEG releases can't decode into a caller-supplied array
+_TJ_DECODE_DST = _tj is not None and "dst" in inspect.signature(_tj.decode).parameters
+_decode_scratch = threading.local()
+
+def _scratch_frame(shape: Tuple[int, int, int]) -> np.ndarray:
+    """This thread's reusable decode target, reallocated only when the shape changes."""
+    buf = getattr(_decode_scratch, "buf", None)
+    if buf is None or buf.shape != shape:
+        buf = _decode_scratch.buf = np.empty(shape, dtype=np.uint8)
+    return buf
+
+def _jpeg_width(content: bytes) -> Optional[int]:
+    """Image width from a JPEG's SOF header, without decoding; None if it can't be found."""
+    i, n = 2, len(content)
+    while i + 9 <= n:
+        if content[i] != 0xFF:
+            return None
+        marker = content[i + 1]
+        if marker == 0xFF:          # fill byte
+            i += 1
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            return int.from_bytes(content[i + 7:i + 9], "big")
+        i += 2 + int.from_bytes(content[i + 2:i + 4], "big")
+    return None
+
+def _scale_denom(width: int) -> int:
+    """Largest power-of-two reduction (up to 8) that still leaves at least MAX_WIDTH columns."""
+    denom = 1
+    while MAX_WIDTH > 0 and denom < 8 and width // (denom * 2) >= MAX_WIDTH:
+        denom *= 2
+    return denom
+
+# cv2.imdecode flags that have libjpeg scale during the IDCT, by denominator
+_CV2_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def _decode_jpeg(content: bytes, transient: bool = False) -> Tuple[np.ndarray, int]:
+    """Decode JPEG bytes to BGR, letting libjpeg(-turbo) shrink large sources during the IDCT.
+
+    Returns the frame and the source width, which is larger than the frame's when scaled.
+    Frames still wider than MAX_WIDTH (which the caller downscales), or any frame when
+    transient, may land in a per-thread buffer that the thread's next decode overwrites.
+    """
+    if _gpu_decoder is not None:
+        # nvJPEG decodes to RGB in device memory; the rest of the pipeline is CPU BGR
+        decoded = _gpu_decoder.decode(content)
+        if decoded is not None:
+            img = cv2.cvtColor(np.asarray(decoded.cpu()), cv2.COLOR_RGB2BGR)
+            return img, img.shape[1]
+    if _tj is not None:
+        width, height = _tj.decode_header(content)[:2]
+        denom = _scale_denom(width)
+        out_w, out_h = -(-width // denom), -(-height // denom)
+        kwargs = {}
+        if _TJ_DECODE_DST and (transient or MAX_WIDTH > 0 and out_w > MAX_WIDTH):
+            kwargs["dst"] = _scratch_frame((out_h, out_w, 3))
+        return _tj.decode(content, pixel_format=TJPF_BGR, scaling_factor=(1, denom), **kwargs), width
+    width = _jpeg_width(content)
+    flags = _CV2_REDUCED_FLAGS[_scale_denom(width)] if width else cv2.IMREAD_COLOR
+    img = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), flags)
+    if img is None:
+        raise RuntimeError("cv2.imdecode returned None")
+    return img, width or img.shape[1]
 
-            if MAX_WIDTH > 0 and img.shape[1] > MAX_WIDTH:
-                h, w = img.shape[:2]
-                new_w = MAX_WIDTH
-                new_h = int(h * (new_w / w))
-                img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+@lru_cache(maxsize=8)
+def _target_size(w: int, h: int) -> Optional[Tuple[int, int]]:
+    """(new_w, new_h) to downscale a w x h snapshot to, or None if it already fits.
 
-            with _lock:
-                _latest_frame = img
-                _latest_ts = time.time()
+    The camera's size is fixed, so this is worked out once rather than per frame.
+    """
+    if MAX_WIDTH > 0 and w > MAX_WIDTH:
+        return MAX_WIDTH, int(h * (MAX_WIDTH / w))
+    return None
+
+def _decode_snapshot(content: bytes) -> Tuple[np.ndarray, bytes]:
+    """Decode a JPEG snapshot and downscale it to MAX_WIDTH if needed; returns the frame and its JPEG bytes."""
+    img, source_width = _decode_jpeg(content)
+
+    h, w = img.shape[:2]
+    size = _target_size(w, h)
+    if size is not None:
+        img = _downscale(img, *size)
+
+    # Upstream is already a JPEG; only re-encode when the frame ended up smaller
+    jpg = content if img.shape[1] == source_width else _encode_jpeg(img)
+    return img, jpg
+
+def _publish_frame(img: np.ndarray, jpg: bytes):
+    """Make a new frame current and wake every waiting MJPEG viewer."""
+    global _latest, _new_frame
+    _latest = (img, time.time(), jpg)
+    _recent_frames.append((jpg, _latest[1]))
+    event, _new_frame = _new_frame, asyncio.Event()
+    event.set()
+
+def _read_snapshot() -> Optional[Tuple[np.ndarray, float, bytes]]:
+    """Return the current snapshot, marking the stream as in use so the reader polls at full rate."""
+    global _last_frame_read
+    _last_frame_read = time.monotonic()
+    _frame_wanted.set()
+    return _latest
+
+async def _pause_between_polls():
+    """Sleep SNAPSHOT_INTERVAL while the stream is in use, or up to IDLE_SNAPSHOT_INTERVAL when idle."""
+    if _mjpeg_viewers or time.monotonic() - _last_frame_read < IDLE_AFTER_SECONDS:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        return
+    # Idle polls are too sparse to play back at 1 / SNAPSHOT_INTERVAL fps, so
+    # don't let them into the clip buffer
+    _recent_frames.clear()
+    _frame_wanted.clear()
+    with suppress(asyncio.TimeoutError):
+        await asyncio.wait_for(_frame_wanted.wait(), IDLE_SNAPSHOT_INTERVAL)
+
+async def _snapshot_reader(client: httpx.AsyncClient):
+    """Continuously fetch the JPEG and publish it as the latest frame."""
+    backoff = 1.0
+    last_content: Optional[bytes] = None
+    last_modified: Optional[str] = None
+    etag: Optional[str] = None
+    while True:
+        try:
+            # Conditional GET: an unchanged snapshot comes back as an empty 304
+            headers = {}
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+            if etag:
+                headers["If-None-Match"] = etag
+
+            r = await client.get(_SNAPSHOT_URL_TEMPLATE.format(int(time.time()*1000)), headers=headers)
+            if r.status_code != 304:
+                r.raise_for_status()
+
+            if _latest is not None and (r.status_code == 304 or r.content == last_content):
+                # Camera hasn't refreshed: skip the decode/encode and don't wake viewers,
+                # but keep the clip buffer at one entry per poll so clips stay real-time
+                _recent_frames.append((_latest[2], time.time()))
+            else:
+                # Decode/resize/encode are CPU-bound; keep them off the event loop
+                img, jpg = await asyncio.to_thread(_decode_snapshot, r.content)
+                _publish_frame(img, jpg)
+                last_content = r.content
+                # Only revalidate against a snapshot that actually got published
+                last_modified = r.headers.get("Last-Modified")
+                etag = r.headers.get("ETag")
 
             backoff = 1.0
-            time.sleep(SNAPSHOT_INTERVAL)
+            await _pause_between_polls()
 
         except Exception as e:
             print(f"[SNAPSHOT] Error: {e}. Retrying in {backoff:.1f}s")
-            time.sleep(backoff)
+            await asyncio.sleep(backoff)
             backoff = min(20.0, backoff * 2.0)
 
+# (collection, keys, options) for the indexes backing the hot query patterns
+DB_INDEXES = [
+    ("users", "email", {"unique": True}),
+    ("users", "id", {"unique": True}),
+    ("rounds", [("user_id", 1), ("created_at", -1)], {}),
+    ("rounds", [("id", 1), ("user_id", 1)], {}),
+    ("video_clips", [("round_id", 1), ("hole_number", 1)], {}),
+]
+
+async def create_db_indexes():
+    """Create indexes backing the hot query patterns (no-op if they already exist)"""
+    # Each index on its own, so one failure (e.g. duplicate emails blocking the
+    # unique index) doesn't leave the rest uncreated
+    for collection, keys, options in DB_INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except ConnectionFailure as e:
+            # Mongo is unreachable; the remaining indexes would each wait out the same timeout
+            logger.error(f"Failed to create database indexes, Mongo unreachable: {e}")
+            return
+        except Exception as e:
+            logger.error(f"Failed to create index {keys!r} on {collection}: {e}")
+
+# video_clips records waiting for _clip_writer, which inserts them in batches so
+# clip endpoints return without waiting on a Mongo write; None stops the writer
+CLIP_INSERT_BATCH = 100
+CLIP_INSERT_WAIT = 0.05   # seconds to let a batch gather after its first record
+_clip_inserts: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+
+async def _clip_writer():
+    """Drain _clip_inserts into video_clips with one insert_many per batch."""
+    while True:
+        docs = [await _clip_inserts.get()]
+        await asyncio.sleep(CLIP_INSERT_WAIT)
+        while len(docs) < CLIP_INSERT_BATCH and not _clip_inserts.empty():
+            docs.append(_clip_inserts.get_nowait())
+        # The stop marker is queued last, so it can only end a batch
+        stop = docs[-1] is None
+        if stop:
+            docs.pop()
+        if docs:
+            try:
+                await db.video_clips.insert_many(docs, ordered=False)
+            except Exception as e:
+                print(f"[CLIPS] Failed to insert {len(docs)} clip record(s): {e}")
+        if stop:
+            return
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Index builds run in the background so an unreachable Mongo doesn't hold up
+    # serving (the stream routes don't need it)
+    indexer = asyncio.create_task(create_db_indexes())
+    clip_writer = asyncio.create_task(_clip_writer())
     print(f"[startup] Polling snapshot: {SNAPSHOT_URL}")
-    t = threading.Thread(target=_snapshot_reader_loop, daemon=True)
-    t.start()
+    # One kept-alive connection: every poll goes to the same origin
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(10.0, connect=3.05),
+        limits=httpx.Limits(max_connections=1, max_keepalive_connections=1, keepalive_expiry=300),
+    )
+    reader = asyncio.create_task(_snapshot_reader(client))
     yield
-    global _reader_running
-    _reader_running = False
     print("[shutdown] Reader stopping…")
+    indexer.cancel()
+    reader.cancel()
+    with suppress(asyncio.CancelledError):
+        await reader
+    await client.aclose()
+    # Let queued clip records reach the database before shutting down
+    _clip_inserts.put_nowait(None)
+    await clip_writer
+    _encode_pool.shutdown(wait=False)
+    _password_pool.shutdown(wait=False)
 
 # Create the main app
-app = FastAPI(title="Birdieo.ai API", lifespan=lifespan)
+app = FastAPI(title="Birdieo.ai API", lifespan=lifespan, default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
+class UploadStaticFiles(StaticFiles):
+    """StaticFiles that lets browsers cache uploads whose names are never reused."""
+    # Photo and clip names carry a random/uuid component, so their bytes never change
+    IMMUTABLE_DIRS = frozenset({"player_photos", "video_clips"})
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if Path(full_path).parent.name in self.IMMUTABLE_DIRS:
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
 # Serve static files
-app.mount("/uploads", StaticFiles(directory=str(ROOT_DIR / "uploads")), name="uploads")
+app.mount("/uploads", UploadStaticFiles(directory=str(ROOT_DIR / "uploads")), name="uploads")
 
 # Pydantic Models
 class UserCreate(BaseModel):
@@ -182,8 +531,8 @@ class PlayerPhoto(BaseModel):
 class Round(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    subject_id: str = Field(default_factory=lambda: f"SUB{str(uuid.uuid4())[:6].upper()}")
-    round_id: str = Field(default_factory=lambda: f"R{str(uuid.uuid4())[:6].upper()}")
+    subject_id: str = Field(default_factory=lambda: f"SUB{secrets.token_hex(3).upper()}")
+    round_id: str = Field(default_factory=lambda: f"R{secrets.token_hex(3).upper()}")
     course_name: str
     tee_time: datetime
     handedness: str
@@ -205,6 +554,9 @@ class VideoClip(BaseModel):
     frame_accuracy_score: Optional[float] = None
 
 class PersonDetection(BaseModel):
+    # Detections are cached per snapshot and shared between requests, so they're read-only
+    model_config = ConfigDict(frozen=True)
+
     person_id: str
     confidence: float
     box: Dict[str, int]  # x, y, w, h
@@ -213,6 +565,8 @@ class PersonDetection(BaseModel):
     last_seen: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class DetectionResult(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     label: str
     confidence: float
     box: Dict[str, int]  # x, y, w, h
@@ -227,11 +581,20 @@ class AnalysisResponse(BaseModel):
     ts: Optional[float] = None
     reason: Optional[str] = None
 
+# List adapters so whole result sets validate and serialize in pydantic-core in one call
+_ROUND_LIST = TypeAdapter(List[Round])
+_CLIP_LIST = TypeAdapter(List[VideoClip])
+_ROUND_LIST_PROJECTION = {"_id": 0, "player_photos.clothing_analysis": 0}
+
+def json_response(body: bytes) -> Response:
+    """Wrap JSON already serialized by pydantic-core, bypassing jsonable_encoder."""
+    return Response(content=body, media_type="application/json")
+
 # Helper Functions
 def create_jwt_token(user_id: str) -> str:
     payload = {
         'user_id': user_id,
-        'exp': datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
+        'exp': int(time.time()) + JWT_EXPIRATION_SECONDS
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
@@ -247,11 +610,15 @@ def verify_jwt_token(token: str) -> str:
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     return verify_jwt_token(credentials.credentials)
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# bcrypt is deliberately slow; run it on the password pool so it doesn't stall the event loop
+async def hash_password(password: str) -> str:
+    hashed = await asyncio.get_running_loop().run_in_executor(
+        _password_pool, bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    return hashed.decode('utf-8')
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+async def verify_password(password: str, hashed: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(
+        _password_pool, bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
 
 def calculate_box_center(box: Dict[str, int]) -> Dict[str, int]:
     """Calculate center point of bounding box"""
@@ -264,113 +631,192 @@ def calculate_distance(point1: Dict[str, int], point2: Dict[str, int]) -> float:
     """Calculate Euclidean distance between two points"""
     return ((point1["x"] - point2["x"]) ** 2 + (point1["y"] - point2["y"]) ** 2) ** 0.5
 
+def _clamp_boxes(detections: List[Dict[str, Any]], w: int, h: int,
+                 min_w: int, min_h: int, sx: float = 1.0, sy: float = 1.0) -> np.ndarray:
+    """Clamp detection boxes into a w x h frame in one vectorized pass; returns (N, 4) x, y, w, h rows.
+
+    Coordinates are first scaled by (sx, sy), mapping boxes from a downscaled detection copy.
+    """
+    boxes = np.array([[d["box"]["x"], d["box"]["y"], d["box"]["w"], d["box"]["h"]] for d in detections],
+                     dtype=np.float64).reshape(-1, 4)
+    boxes[:, 0::2] *= sx
+    boxes[:, 1::2] *= sy
+    boxes = boxes.astype(np.int64)
+    boxes[:, 0] = np.clip(boxes[:, 0], 0, w - 1)
+    boxes[:, 1] = np.clip(boxes[:, 1], 0, h - 1)
+    # Minimum size wins over the frame edge, as the per-box max(min, min(...)) did
+    boxes[:, 2] = np.maximum(np.minimum(boxes[:, 2], w - boxes[:, 0]), min_w)
+    boxes[:, 3] = np.maximum(np.minimum(boxes[:, 3], h - boxes[:, 1]), min_h)
+    return boxes
+
+def _nearest_track_numpy(centers: np.ndarray, last_seen: np.ndarray, n: int, now: float,
+                         cx: int, cy: int, max_age: float, max_d2: int) -> int:
+    """Row of the nearest track seen within max_age and closer than sqrt(max_d2), or -1."""
+    d2 = ((centers[:n] - (cx, cy)) ** 2).sum(axis=1).astype(np.float64)
+    d2[now - last_seen[:n] >= max_age] = np.inf
+    idx = int(d2.argmin())
+    return idx if d2[idx] < max_d2 else -1
+
+def _nearest_track_loop(centers, last_seen, n, now, cx, cy, max_age, max_d2):
+    # Same match as _nearest_track_numpy, written as a scalar loop for numba to compile
+    best, best_d2 = -1, max_d2
+    for i in range(n):
+        if now - last_seen[i] < max_age:
+            dx = centers[i, 0] - cx
+            dy = centers[i, 1] - cy
+            d2 = dx * dx + dy * dy
+            if d2 < best_d2:
+                best, best_d2 = i, d2
+    return best
+
+# One fused pass without temporaries when numba is installed, else the NumPy version
+_nearest_track = njit(cache=True, nogil=True)(_nearest_track_loop) if njit is not None else _nearest_track_numpy
+
+def _evict_stale_tracks(now: float) -> int:
+    """Forget persons unseen for TRACK_EVICT_AFTER_SECONDS, compacting the track arrays; returns the new count."""
+    n = len(_track_ids)
+    stale = now - _track_last_seen[:n] >= TRACK_EVICT_AFTER_SECONDS
+    if not stale.any():
+        return n
+    for i in np.flatnonzero(stale):
+        del _person_tracker[_track_ids[i]]
+    keep = np.flatnonzero(~stale)
+    m = len(keep)
+    _track_centers[:m] = _track_centers[keep]
+    _track_last_seen[:m] = _track_last_seen[keep]
+    _track_ids[:] = [_track_ids[i] for i in keep]
+    return m
+
 def assign_person_id(detection_box: Dict[str, int], confidence: float) -> str:
     """Assign unique ID to detected person based on location tracking"""
-    global _next_person_id, _person_tracker
+    global _person_tracker, _track_centers, _track_last_seen
     
     current_time = datetime.now(timezone.utc)
+    now = current_time.timestamp()
     center_point = calculate_box_center(detection_box)
+    center = (center_point["x"], center_point["y"])
     
-    with _person_id_lock:
-        # Find closest existing person (within reasonable distance)
-        min_distance = float('inf')
-        closest_person_id = None
-        
-        for person_id, person_info in _person_tracker.items():
-            # Only consider persons seen in last 30 seconds
-            time_diff = (current_time - person_info["last_seen"]).total_seconds()
-            if time_diff < 30:
-                distance = calculate_distance(center_point, person_info["center_point"])
-                if distance < min_distance and distance < 100:  # 100 pixels threshold
-                    min_distance = distance
-                    closest_person_id = person_id
-        
-        if closest_person_id:
-            # Update existing person
-            _person_tracker[closest_person_id].update({
-                "box": detection_box,
-                "center_point": center_point,
-                "last_seen": current_time,
-                "confidence": confidence
-            })
-            return closest_person_id
-        else:
-            # Create new person
-            new_person_id = f"P{_next_person_id:03d}"
-            _next_person_id += 1
-            
-            _person_tracker[new_person_id] = {
-                "box": detection_box,
-                "center_point": center_point,
-                "first_seen": current_time,
-                "last_seen": current_time,
-                "confidence": confidence
-            }
-            
-            return new_person_id
-
-def draw_bounding_boxes(frame: np.ndarray, persons: List[PersonDetection]) -> np.ndarray:
-    """Draw bounding boxes and labels on frame"""
-    frame_copy = frame.copy()
+    # Find closest recently seen person, comparing squared distances in one pass
+    n = len(_track_ids)
+    closest = -1
+    if n:
+        closest = _nearest_track(_track_centers, _track_last_seen, n, now, center[0], center[1],
+                                 TRACK_MAX_AGE_SECONDS, TRACK_MAX_DISTANCE ** 2)
     
-    for person in persons:
-        box = person.box
-        person_id = person.person_id
-        confidence = person.confidence
+    if closest >= 0:
+        # Update existing person
+        closest_person_id = _track_ids[closest]
+        _track_centers[closest] = center
+        _track_last_seen[closest] = now
+        _person_tracker[closest_person_id].update({
+            "box": detection_box,
+            "center_point": center_point,
+            "last_seen": current_time,
+            "confidence": confidence
+        })
+        return closest_person_id
+    else:
+        # Create new person
+        new_person_id = f"P{next(_person_ids):03d}"
         
-        # Define colors (BGR format for OpenCV)
-        box_color = (0, 255, 0)  # Green
-        text_color = (255, 255, 255)  # White
-        bg_color = (0, 200, 0)  # Dark green for text background
+        # Reuse rows of long-gone persons before growing, so memory tracks the live count
+        if n == len(_track_centers):
+            n = _evict_stale_tracks(now)
+        if n == len(_track_centers):
+            _track_centers = np.concatenate((_track_centers, np.zeros_like(_track_centers)))
+            _track_last_seen = np.concatenate((_track_last_seen, np.zeros_like(_track_last_seen)))
+        _track_ids.append(new_person_id)
+        _track_centers[n] = center
+        _track_last_seen[n] = now
         
-        # Draw bounding box
-        cv2.rectangle(frame_copy, 
-                     (box["x"], box["y"]), 
-                     (box["x"] + box["w"], box["y"] + box["h"]), 
-                     box_color, 2)
+        _person_tracker[new_person_id] = {
+            "box": detection_box,
+            "center_point": center_point,
+            "first_seen": current_time,
+            "last_seen": current_time,
+            "confidence": confidence
+        }
         
-        # Prepare label text
-        label = f"{person_id} ({confidence:.2f})"
+        return new_person_id
+
+# Drawing style for draw_bounding_boxes (BGR colors)
+_BOX_COLOR = (0, 255, 0)          # Green
+_LABEL_TEXT_COLOR = (255, 255, 255)  # White
+_LABEL_BG_COLOR = (0, 200, 0)     # Dark green for text background
+_LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+_LABEL_SCALE = 0.6
+_LABEL_TEXT_HEIGHT = cv2.getTextSize("P", _LABEL_FONT, _LABEL_SCALE, 2)[0][1]
+
+def draw_bounding_boxes(frame: np.ndarray, persons: List[PersonDetection], *,
+                        out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Draw bounding boxes and labels on frame.
+
+    Draws into out (which must already hold the frame's pixels, and may be frame itself)
+    when given; otherwise onto a copy, leaving frame untouched.
+    """
+    frame_copy = frame.copy() if out is None else out
+    if not persons:
+        return frame_copy
+    
+    # All outlines in one polylines call: (N, 4, 2) corner arrays
+    boxes = np.array([[p.box["x"], p.box["y"], p.box["w"], p.box["h"]] for p in persons], dtype=np.int32)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    corners = np.stack([np.stack(c, axis=1) for c in ((x0, y0), (x1, y0), (x1, y1), (x0, y1))], axis=1)
+    cv2.polylines(frame_copy, corners, True, _BOX_COLOR, 2)
+    centers = boxes[:, :2] + boxes[:, 2:] // 2
+    
+    # Labels go on top of every outline
+    for person, (x, y), center in zip(persons, boxes[:, :2].tolist(), centers.tolist()):
+        label = f"{person.person_id} ({person.confidence:.2f})"
         
-        # Get text size for background rectangle
-        (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+        # Only the width depends on the text; the height is fixed by font/scale/thickness
+        (text_width, _), _ = cv2.getTextSize(label, _LABEL_FONT, _LABEL_SCALE, 2)
         
         # Draw text background
         cv2.rectangle(frame_copy,
-                     (box["x"], box["y"] - text_height - 10),
-                     (box["x"] + text_width + 10, box["y"]),
-                     bg_color, -1)
+                     (x, y - _LABEL_TEXT_HEIGHT - 10),
+                     (x + text_width + 10, y),
+                     _LABEL_BG_COLOR, -1)
         
         # Draw text
-        cv2.putText(frame_copy, label,
-                   (box["x"] + 5, box["y"] - 5),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, text_color, 2)
+        cv2.putText(frame_copy, label, (x + 5, y - 5), _LABEL_FONT, _LABEL_SCALE, _LABEL_TEXT_COLOR, 2)
         
         # Draw center point
-        center = calculate_box_center(box)
-        cv2.circle(frame_copy, (center["x"], center["y"]), 3, (0, 0, 255), -1)  # Red dot
+        cv2.circle(frame_copy, tuple(center), 3, (0, 0, 255), -1)  # Red dot
     
     return frame_copy
 
+def _annotate_jpeg(frame: np.ndarray, persons: List[PersonDetection]) -> bytes:
+    """JPEG of frame with detections drawn on a private copy (frame itself is left intact)."""
+    return _encode_jpeg(draw_bounding_boxes(frame, persons))
+
+# (hole key, minutes after tee time) for holes 1-18, 15 minutes apart; keys are strings for BSON
+_TIMELINE_OFFSETS = tuple((str(hole), 15 * (hole - 1)) for hole in range(1, 19))
+
 def generate_expected_timeline(tee_time: datetime) -> Dict[str, str]:
     """Generate expected timeline for 18 holes (15 minutes apart)"""
-    timeline = {}
-    current_time = tee_time
-    for hole in range(1, 19):
-        timeline[str(hole)] = current_time.strftime("%H:%M")
-        current_time += timedelta(minutes=15)
-    return timeline
+    # Same as (tee_time + offset).strftime("%H:%M"): aware datetime addition is wall-clock
+    # and seconds never carry into the minute, so plain minute-of-day arithmetic suffices
+    start = tee_time.hour * 60 + tee_time.minute
+    return {hole: "%02d:%02d" % divmod((start + offset) % 1440, 60) for hole, offset in _TIMELINE_OFFSETS}
+
+def new_vision_chat(session_prefix: str, system_message: str) -> LlmChat:
+    """Create a vision chat session from the module-level configuration.
+
+    LlmChat keeps per-session message history, so each call gets its own session
+    rather than sharing one across concurrent requests.
+    """
+    return LlmChat(
+        api_key=EMERGENT_LLM_KEY,
+        session_id=f"{session_prefix}-{uuid.uuid4()}",
+        system_message=system_message
+    ).with_model(*VISION_MODEL)
 
 async def analyze_clothing_with_ai(image_path: str, angle: str) -> ClothingAnalysis:
     """Analyze clothing using OpenAI vision model with detailed structure"""
     try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"clothing-analysis-{uuid.uuid4()}",
-            system_message="""You are an expert at analyzing clothing in golf course photos for player identification. 
-            Provide detailed, specific descriptions that would help identify a person on a golf course. 
-            Focus on colors, patterns, styles, and distinctive features."""
-        ).with_model("openai", "gpt-4o")
+        chat = new_vision_chat("clothing-analysis", CLOTHING_ANALYSIS_SYSTEM_MESSAGE)
         
         image_content = ImageContent(file_path=image_path)
         
@@ -396,7 +842,7 @@ async def analyze_clothing_with_ai(image_path: str, angle: str) -> ClothingAnaly
         response = await chat.send_message(user_message)
         
         try:
-            clothing_data = json.loads(response)
+            clothing_data = orjson.loads(response)
             
             # Create ClothingAnalysis object
             clothing_items = {}
@@ -449,6 +895,29 @@ async def analyze_clothing_with_ai(image_path: str, angle: str) -> ClothingAnaly
             overall_confidence=0.0
         )
 
+def _write_clip(frames: List[Tuple[bytes, float]], clip_path: Path) -> int:
+    """Decode buffered JPEG snapshots and write them to an mp4; returns frames written."""
+    fps = 1.0 / SNAPSHOT_INTERVAL
+    writer = None
+    written = 0
+    try:
+        for jpg, _ in frames:
+            try:
+                img, _ = _decode_jpeg(jpg, transient=True)   # written out before the next decode
+            except (RuntimeError, OSError):
+                continue
+            if writer is None:
+                h, w = img.shape[:2]
+                writer = cv2.VideoWriter(str(clip_path), cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+            elif img.shape[:2] != (h, w):
+                continue  # source changed resolution mid-buffer
+            writer.write(img)
+            written += 1
+    finally:
+        if writer is not None:
+            writer.release()
+    return written
+
 async def save_stream_clip(duration_seconds: int = 30) -> str:
     """Save a stream clip locally for better processing"""
     try:
@@ -467,28 +936,16 @@ async def save_stream_clip(duration_seconds: int = 30) -> str:
 
 async def detect_persons_in_frame_enhanced(frame: np.ndarray) -> List[PersonDetection]:
     """Enhanced person detection using more accurate AI model"""
+    h, w = frame.shape[:2]   # read once; the prompt and the box clamp both use it
     try:
-        # Encode frame as JPEG with higher quality
-        _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 95])
-        image_b64 = base64.b64encode(buffer).decode('utf-8')
+        # The model sees a copy capped at DETECT_MAX_DIM; its boxes are scaled back to w x h
+        dw, dh = _detection_size(w, h)
+        image_content = await encode_vision_image(frame, (dw, dh))
         
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"enhanced-person-detection-{uuid.uuid4()}",
-            system_message="""You are an expert computer vision system specialized in accurate person detection and tracking on golf courses. 
-            Your task is to identify each person with high precision, providing tight, accurate bounding boxes.
-            Focus on:
-            1. Precise bounding box coordinates that tightly fit each person
-            2. High confidence scoring based on clear visibility
-            3. Distinguishing between golfers, caddies, and spectators
-            4. Accurate pixel-level coordinates (not percentages)"""
-        ).with_model("openai", "gpt-4o")
-        
-        image_content = ImageContent(image_base64=image_b64)
-        h, w = frame.shape[:2]
+        chat = new_vision_chat("enhanced-person-detection", ENHANCED_PERSON_DETECTION_SYSTEM_MESSAGE)
         
         user_message = UserMessage(
-            text=f"""Analyze this golf course image (size: {w}x{h} pixels) for person detection with maximum accuracy.
+            text=f"""Analyze this golf course image (size: {dw}x{dh} pixels) for person detection with maximum accuracy.
 
             For each person detected:
             1. Provide PRECISE bounding box coordinates in PIXELS (not percentages)
@@ -506,7 +963,7 @@ async def detect_persons_in_frame_enhanced(frame: np.ndarray) -> List[PersonDete
             }}]
             
             Requirements:
-            - Coordinates must be actual pixels within {w}x{h}
+            - Coordinates must be actual pixels within {dw}x{dh}
             - Confidence > 0.8 for clear detections only
             - Box should be tight around person silhouette
             - Include person_type and visibility assessment""",
@@ -516,31 +973,29 @@ async def detect_persons_in_frame_enhanced(frame: np.ndarray) -> List[PersonDete
         response = await chat.send_message(user_message)
         
         try:
-            detections_data = json.loads(response)
+            detections_data = orjson.loads(response)
             persons = []
             
-            for detection in detections_data:
-                if detection.get("label") == "person":
-                    box = detection["box"]
-                    confidence = detection.get("confidence", 0.8)
-                    
-                    # Validate and clamp coordinates
-                    box["x"] = max(0, min(box["x"], w - 1))
-                    box["y"] = max(0, min(box["y"], h - 1))
-                    box["w"] = max(10, min(box["w"], w - box["x"]))  # Minimum width 10px
-                    box["h"] = max(20, min(box["h"], h - box["y"]))  # Minimum height 20px
+            # Validate and clamp coordinates (minimum 10px wide, 20px tall)
+            detections = [d for d in detections_data if d.get("label") == "person"]
+            boxes = _clamp_boxes(detections, w, h, 10, 20, w / dw, h / dh)
+            centers = boxes[:, :2] + boxes[:, 2:] // 2
+            
+            for detection, (x, y, bw, bh), (cx, cy) in zip(detections, boxes.tolist(), centers.tolist()):
+                confidence = detection.get("confidence", 0.8)
+                
+                # Only include high-confidence detections
+                if confidence >= 0.7:
+                    box = {"x": x, "y": y, "w": bw, "h": bh}
+                    person_id = assign_person_id(box, confidence)
                     
-                    # Only include high-confidence detections
-                    if confidence >= 0.7:
-                        person_id = assign_person_id(box, confidence)
-                        
-                        person = PersonDetection(
-                            person_id=person_id,
-                            confidence=confidence,
-                            box=box,
-                            center_point=calculate_box_center(box)
-                        )
-                        persons.append(person)
+                    person = PersonDetection(
+                        person_id=person_id,
+                        confidence=confidence,
+                        box=box,
+                        center_point={"x": cx, "y": cy}
+                    )
+                    persons.append(person)
             
             return persons
             
@@ -553,6 +1008,16 @@ async def detect_persons_in_frame_enhanced(frame: np.ndarray) -> List[PersonDete
         print(f"Enhanced person detection error: {e}")
         return await detect_persons_in_frame_fallback(frame)
 
+async def detect_persons_in_snapshot(snap: Tuple[np.ndarray, float, bytes]) -> List[PersonDetection]:
+    """Run enhanced detection at most once per snapshot; concurrent callers share the result."""
+    global _detection_cache
+    img, ts, _ = snap
+    cached = _detection_cache
+    if cached is None or cached[0] != ts:
+        cached = _detection_cache = (ts, asyncio.ensure_future(detect_persons_in_frame_enhanced(img)))
+    # Shielded so one client disconnecting doesn't cancel the detection others are awaiting
+    return await asyncio.shield(cached[1])
+
 async def detect_persons_in_frame_fallback(frame: np.ndarray) -> List[PersonDetection]:
     """Fallback person detection method"""
     h, w = frame.shape[:2]
@@ -568,24 +1033,16 @@ async def detect_persons_in_frame_fallback(frame: np.ndarray) -> List[PersonDete
 
 async def detect_persons_in_frame(frame: np.ndarray) -> List[PersonDetection]:
     """Detect persons in frame using AI vision model and assign unique IDs"""
+    h, w = frame.shape[:2]   # read once; the prompt, the box clamp and the demo boxes all use it
     try:
-        # Encode frame as JPEG
-        _, buffer = cv2.imencode('.jpg', frame)
-        image_b64 = base64.b64encode(buffer).decode('utf-8')
-        
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"person-detection-{uuid.uuid4()}",
-            system_message="""You are an expert at detecting people in golf course video frames. 
-            For each person detected, provide bounding box coordinates as pixel values (not percentages).
-            Return accurate bounding boxes that tightly fit around each person."""
-        ).with_model("openai", "gpt-4o")
+        # The model sees a copy capped at DETECT_MAX_DIM; its boxes are scaled back to w x h
+        dw, dh = _detection_size(w, h)
+        image_content = await encode_vision_image(frame, (dw, dh))
         
-        image_content = ImageContent(image_base64=image_b64)
-        h, w = frame.shape[:2]
+        chat = new_vision_chat("person-detection", PERSON_DETECTION_SYSTEM_MESSAGE)
         
         user_message = UserMessage(
-            text=f"""Detect all people in this golf course image (image size: {w}x{h} pixels). 
+            text=f"""Detect all people in this golf course image (image size: {dw}x{dh} pixels). 
             For each person, provide bounding box coordinates as PIXEL VALUES (not percentages).
             Return as JSON array: [{{"label": "person", "confidence": 0.9, "box": {{"x": 100, "y": 150, "w": 80, "h": 200}}}}]
             Make sure x, y, w, h are actual pixel coordinates, not percentages.""",
@@ -595,38 +1052,35 @@ async def detect_persons_in_frame(frame: np.ndarray) -> List[PersonDetection]:
         response = await chat.send_message(user_message)
         
         try:
-            detections_data = json.loads(response)
+            detections_data = orjson.loads(response)
             persons = []
             
-            for detection in detections_data:
-                if detection.get("label") == "person":
-                    box = detection["box"]
-                    confidence = detection.get("confidence", 0.8)
-                    
-                    # Ensure coordinates are within frame bounds
-                    box["x"] = max(0, min(box["x"], w - 1))
-                    box["y"] = max(0, min(box["y"], h - 1))
-                    box["w"] = max(1, min(box["w"], w - box["x"]))
-                    box["h"] = max(1, min(box["h"], h - box["y"]))
-                    
-                    # Assign unique person ID
-                    person_id = assign_person_id(box, confidence)
-                    
-                    # Create PersonDetection object
-                    person = PersonDetection(
-                        person_id=person_id,
-                        confidence=confidence,
-                        box=box,
-                        center_point=calculate_box_center(box)
-                    )
-                    persons.append(person)
+            # Ensure coordinates are within frame bounds
+            detections = [d for d in detections_data if d.get("label") == "person"]
+            boxes = _clamp_boxes(detections, w, h, 1, 1, w / dw, h / dh)
+            centers = boxes[:, :2] + boxes[:, 2:] // 2
+            
+            for detection, (x, y, bw, bh), (cx, cy) in zip(detections, boxes.tolist(), centers.tolist()):
+                confidence = detection.get("confidence", 0.8)
+                box = {"x": x, "y": y, "w": bw, "h": bh}
+                
+                # Assign unique person ID
+                person_id = assign_person_id(box, confidence)
+                
+                # Create PersonDetection object
+                person = PersonDetection(
+                    person_id=person_id,
+                    confidence=confidence,
+                    box=box,
+                    center_point={"x": cx, "y": cy}
+                )
+                persons.append(person)
             
             return persons
             
         except Exception as parse_error:
             print(f"AI response parsing error: {parse_error}")
             # Return demo detection if AI fails
-            h, w = frame.shape[:2]
             demo_box = {"x": int(w*0.25), "y": int(h*0.25), "w": int(w*0.5), "h": int(h*0.5)}
             person_id = assign_person_id(demo_box, 0.5)
             
@@ -640,7 +1094,6 @@ async def detect_persons_in_frame(frame: np.ndarray) -> List[PersonDetection]:
     except Exception as e:
         print(f"Person detection error: {e}")
         # Return demo detection
-        h, w = frame.shape[:2]
         demo_box = {"x": int(w*0.25), "y": int(h*0.25), "w": int(w*0.5), "h": int(h*0.5)}
         person_id = assign_person_id(demo_box, 0.5)
         
@@ -655,18 +1108,18 @@ async def detect_persons_in_frame(frame: np.ndarray) -> List[PersonDetection]:
 @api_router.post("/auth/register")
 async def register_user(user_data: UserCreate):
     # Check if user already exists
-    existing_user = await db.users.find_one({"email": user_data.email})
+    existing_user = await db.users.find_one({"email": user_data.email}, _EXISTS_PROJECTION)
     if existing_user:
         raise HTTPException(status_code=400, detail="User already exists")
     
     # Create new user
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password(user_data.password)
     user = User(
         name=user_data.name,
         email=user_data.email
     )
     
-    user_dict = user.dict()
+    user_dict = user.model_dump()
     user_dict['password'] = hashed_password
     
     await db.users.insert_one(user_dict)
@@ -688,7 +1141,7 @@ async def login_user(login_data: UserLogin):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Verify password
-    if not verify_password(login_data.password, user_doc['password']):
+    if not await verify_password(login_data.password, user_doc['password']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Create JWT token
@@ -704,7 +1157,7 @@ async def login_user(login_data: UserLogin):
 
 @api_router.get("/auth/me")
 async def get_current_user_info(user_id: str = Depends(get_current_user)):
-    user_doc = await db.users.find_one({"id": user_id})
+    user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
     if not user_doc:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -725,7 +1178,7 @@ async def start_checkin(
         expected_timeline=generate_expected_timeline(checkin_data.tee_time)
     )
     
-    await db.rounds.insert_one(round_obj.dict())
+    await db.rounds.insert_one(round_obj.model_dump())
     
     return {
         "message": "Check-in started",
@@ -768,18 +1221,20 @@ async def upload_player_photo(
     user_id: str = Depends(get_current_user)
 ):
     # Verify round belongs to user
-    round_doc = await db.rounds.find_one({"id": round_id, "user_id": user_id})
+    round_doc = await db.rounds.find_one({"id": round_id, "user_id": user_id}, _EXISTS_PROJECTION)
     if not round_doc:
         raise HTTPException(status_code=404, detail="Round not found")
     
     # Save file
     file_extension = file.filename.split('.')[-1] if file.filename else 'jpg'
-    filename = f"{round_id}_{angle}_{int(time.time())}.{file_extension}"
+    # Random suffix keeps names unique (same-second re-uploads would otherwise overwrite), so they can be cached forever
+    filename = f"{round_id}_{angle}_{int(time.time())}_{secrets.token_hex(4)}.{file_extension}"
     file_path = ROOT_DIR / "uploads" / "player_photos" / filename
     
+    # Copy in 64 KiB chunks so memory stays flat regardless of upload size
     async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await f.write(chunk)
     
     # Analyze clothing with AI (for non-face photos)
     clothing_analysis = None
@@ -796,7 +1251,7 @@ async def upload_player_photo(
     # Update round with photo
     await db.rounds.update_one(
         {"id": round_id},
-        {"$push": {"player_photos": photo.dict()}}
+        {"$push": {"player_photos": photo.model_dump()}}
     )
     
     return {
@@ -811,12 +1266,6 @@ async def confirm_clothing(
     user_id: str = Depends(get_current_user)
 ):
     """Confirm or correct AI clothing analysis"""
-    # Verify round belongs to user
-    round_doc = await db.rounds.find_one({"id": round_id, "user_id": user_id})
-    if not round_doc:
-        raise HTTPException(status_code=404, detail="Round not found")
-    
-    # Update confirmed clothing
     confirmed_clothing = {
         "hat": clothing_confirmation.hat,
         "top": clothing_confirmation.top,
@@ -824,10 +1273,13 @@ async def confirm_clothing(
         "shoes": clothing_confirmation.shoes
     }
     
-    await db.rounds.update_one(
-        {"id": round_id},
+    # Update confirmed clothing; the user_id filter doubles as the ownership check
+    result = await db.rounds.update_one(
+        {"id": round_id, "user_id": user_id},
         {"$set": {"confirmed_clothing": confirmed_clothing}}
     )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Round not found")
     
     return {
         "message": "Clothing confirmed successfully",
@@ -839,17 +1291,16 @@ async def complete_checkin(
     round_id: str,
     user_id: str = Depends(get_current_user)
 ):
-    # Get round
-    round_doc = await db.rounds.find_one({"id": round_id, "user_id": user_id})
+    # Mark round as completed, getting back the fields we need in the same round-trip
+    round_doc = await db.rounds.find_one_and_update(
+        {"id": round_id, "user_id": user_id},
+        {"$set": {"completed": True}},
+        projection={"_id": 0, "subject_id": 1, "round_id": 1},
+        return_document=ReturnDocument.AFTER
+    )
     if not round_doc:
         raise HTTPException(status_code=404, detail="Round not found")
     
-    # Mark round as completed
-    await db.rounds.update_one(
-        {"id": round_id},
-        {"$set": {"completed": True}}
-    )
-    
     # Generate automatic 10-second clip for Hole 1
     try:
         clip_result = await generate_automatic_clip(round_id, round_doc['subject_id'], 1)
@@ -883,8 +1334,8 @@ async def generate_automatic_clip(round_id: str, subject_id: str, hole_number: i
             frame_accuracy_score=0.90
         )
         
-        # Store clip in database
-        await db.video_clips.insert_one(clip.dict())
+        # Store clip in database (written behind by _clip_writer)
+        _clip_inserts.put_nowait(clip.model_dump())
         
         # Update round to mark this hole as having clip generated
         await db.rounds.update_one(
@@ -911,8 +1362,10 @@ async def generate_automatic_clip(round_id: str, subject_id: str, hole_number: i
 
 @api_router.get("/rounds")
 async def get_user_rounds(user_id: str = Depends(get_current_user)):
-    rounds = await db.rounds.find({"user_id": user_id}).sort("created_at", -1).to_list(100)
-    return [Round(**round_doc) for round_doc in rounds]
+    # The list view only counts photos (details come from /rounds/{id}), so leave the
+    # per-photo clothing analyses, the bulk of each document, in the database
+    rounds = await db.rounds.find({"user_id": user_id}, _ROUND_LIST_PROJECTION).sort("created_at", -1).to_list(100)
+    return json_response(_ROUND_LIST.dump_json(_ROUND_LIST.validate_python(rounds)))
 
 @api_router.get("/rounds/{round_id}")
 async def get_round_details(
@@ -923,7 +1376,7 @@ async def get_round_details(
     if not round_doc:
         raise HTTPException(status_code=404, detail="Round not found")
     
-    return Round(**round_doc)
+    return json_response(Round.model_validate(round_doc).model_dump_json().encode())
 
 @api_router.get("/rounds/{round_id}/clips")
 async def get_round_clips(
@@ -931,85 +1384,88 @@ async def get_round_clips(
     user_id: str = Depends(get_current_user)
 ):
     # Verify round belongs to user
-    round_doc = await db.rounds.find_one({"id": round_id, "user_id": user_id})
+    round_doc = await db.rounds.find_one({"id": round_id, "user_id": user_id}, _EXISTS_PROJECTION)
     if not round_doc:
         raise HTTPException(status_code=404, detail="Round not found")
     
     clips = await db.video_clips.find({"round_id": round_id}).sort("hole_number", 1).to_list(100)
-    return [VideoClip(**clip) for clip in clips]
+    return json_response(_CLIP_LIST.dump_json(_CLIP_LIST.validate_python(clips)))
 
 # Live Stream API Routes (from live_api_lexington.py)
 @api_router.get("/stream/health")
-def stream_health():
-    with _lock:
-        has_frame = _latest_frame is not None
-        age = (time.time() - _latest_ts) if has_frame else None
+async def stream_health():
+    snap = _latest
+    has_frame = snap is not None
+    age = (time.time() - snap[1]) if has_frame else None
     return {"ok": has_frame, "age_seconds": age, "source": SNAPSHOT_URL}
 
 @api_router.get("/stream/frame")
-def get_current_frame():
-    with _lock:
-        img = None if _latest_frame is None else _latest_frame.copy()
-    if img is None:
+async def get_current_frame(request: Request):
+    snap = _read_snapshot()
+    if snap is None:
         return Response(status_code=503)
-    ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-    if not ok:
-        return Response(status_code=500)
-    return Response(content=buf.tobytes(), media_type="image/jpeg")
+    # Pollers revalidate with the snapshot timestamp and get an empty 304 until a new one lands
+    headers = {"ETag": f'"{snap[1]:.6f}"', "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snap[2], media_type="image/jpeg", headers=headers)
 
 @api_router.get("/stream/frame-with-detection")
 async def get_frame_with_detection():
     """Get current frame with enhanced person detection boxes and IDs"""
-    with _lock:
-        img = None if _latest_frame is None else _latest_frame.copy()
-    
-    if img is None:
+    global _annotated_cache
+    snap = _read_snapshot()
+    if snap is None:
         return Response(status_code=503)
+    img, ts, jpg = snap
+    
+    # /stream/analyze links here; repeat fetches of one snapshot reuse the annotated JPEG
+    cached = _annotated_cache
+    if cached is not None and cached[0] == ts:
+        return Response(content=cached[1], media_type="image/jpeg")
     
     try:
-        # Use enhanced person detection for better accuracy
-        persons = await detect_persons_in_frame_enhanced(img)
-        
-        # Draw bounding boxes on the frame
-        processed_frame = draw_bounding_boxes(img, persons)
+        # Use enhanced person detection for better accuracy (shared per snapshot)
+        persons = await detect_persons_in_snapshot(snap)
         
-        # Encode the processed frame
-        ok, buf = cv2.imencode(".jpg", processed_frame, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-        if not ok:
-            return Response(status_code=500)
+        # Copy, draw and encode as one job on the JPEG pool; the shared snapshot is only read
+        processed_jpg = await asyncio.get_running_loop().run_in_executor(
+            _encode_pool, _annotate_jpeg, img, persons)
+        _annotated_cache = (ts, processed_jpg)
         
-        return Response(content=buf.tobytes(), media_type="image/jpeg")
+        return Response(content=processed_jpg, media_type="image/jpeg")
         
     except Exception as e:
         print(f"Error processing frame with enhanced detection: {e}")
         # Return original frame if processing fails
-        ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-        if not ok:
-            return Response(status_code=500)
-        return Response(content=buf.tobytes(), media_type="image/jpeg")
+        return Response(content=jpg, media_type="image/jpeg")
+
+MJPEG_BOUNDARY = "frame"
+_MJPEG_PART_PREFIX = b"--" + MJPEG_BOUNDARY.encode() + b"\r\nContent-Type: image/jpeg\r\nContent-Length: "
+
+def _mjpeg_part(jpg: bytes) -> bytes:
+    """Frame JPEG bytes as one part of the /stream/mjpeg multipart response."""
+    return b"".join((_MJPEG_PART_PREFIX, b"%d" % len(jpg), b"\r\n\r\n", jpg, b"\r\n"))
 
 @api_router.get("/stream/mjpeg")
-def mjpeg_stream():
-    boundary = "frame"
-
-    def gen():
-        while True:
-            with _lock:
-                img = None if _latest_frame is None else _latest_frame.copy()
-            if img is None:
-                time.sleep(0.05)
-                continue
-            ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-            if not ok:
-                time.sleep(0.02)
-                continue
-            jpg = buf.tobytes()
-            yield (
-                b"--" + boundary.encode() + b"\r\n"
-                b"Content-Type: image/jpeg\r\n"
-                b"Content-Length: " + str(len(jpg)).encode() + b"\r\n\r\n" +
-                jpg + b"\r\n"
-            )
+async def mjpeg_stream():
+    async def gen():
+        global _mjpeg_viewers
+        # A connected viewer keeps the reader at full rate for as long as it stays
+        _mjpeg_viewers += 1
+        _frame_wanted.set()
+        try:
+            last = None
+            while True:
+                # Sleep until the reader publishes a newer snapshot
+                if _latest is None or _latest is last:
+                    await _new_frame.wait()
+                    continue
+                # Serve the snapshot's pre-encoded bytes; no per-viewer encode
+                last = _latest
+                yield _mjpeg_part(last[2])
+        finally:
+            _mjpeg_viewers -= 1
 
     headers = {
         "Cache-Control": "no-cache, no-store, must-revalidate",
@@ -1018,25 +1474,23 @@ def mjpeg_stream():
     }
     return StreamingResponse(
         gen(),
-        media_type=f"multipart/x-mixed-replace; boundary={boundary}",
+        media_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
         headers=headers,
     )
 
 @api_router.get("/stream/analyze", response_model=AnalysisResponse)
 async def analyze_current_frame():
     """Analyze current frame for enhanced person detection with unique ID tracking"""
-    with _lock:
-        img = None if _latest_frame is None else _latest_frame.copy()
-        ts = _latest_ts
-    
-    if img is None:
-        return AnalysisResponse(ok=False, reason="no frame yet")
+    snap = _read_snapshot()
+    if snap is None:
+        return json_response(AnalysisResponse(ok=False, reason="no frame yet").model_dump_json().encode())
+    img, ts, _ = snap
     
     h, w = img.shape[:2]
     
-    # Use enhanced person detection for better accuracy
+    # Use enhanced person detection for better accuracy (shared per snapshot)
     try:
-        persons = await detect_persons_in_frame_enhanced(img)
+        persons = await detect_persons_in_snapshot(snap)
         
         # Convert PersonDetection to DetectionResult for backward compatibility
         detections = []
@@ -1048,7 +1502,8 @@ async def analyze_current_frame():
             )
             detections.append(detection)
         
-        return AnalysisResponse(
+        # Serialized in pydantic-core; returning the model would re-encode it via jsonable_encoder
+        return json_response(AnalysisResponse(
             ok=True,
             ts=ts,
             width=w,
@@ -1056,7 +1511,7 @@ async def analyze_current_frame():
             detections=detections,
             persons=persons,
             processed_frame_url=f"/api/stream/frame-with-detection"
-        )
+        ).model_dump_json().encode())
     except Exception as e:
         print(f"Enhanced analysis error: {e}")
         # Return demo detection with higher quality positioning
@@ -1076,7 +1531,7 @@ async def analyze_current_frame():
             box=demo_box
         )
         
-        return AnalysisResponse(
+        return json_response(AnalysisResponse(
             ok=True,
             ts=ts,
             width=w,
@@ -1084,30 +1539,29 @@ async def analyze_current_frame():
             detections=[demo_detection],
             persons=[demo_person],
             processed_frame_url=f"/api/stream/frame-with-detection"
-        )
+        ).model_dump_json().encode())
 
 @api_router.get("/stream/persons")
 async def get_tracked_persons():
     """Get information about currently tracked persons"""
-    global _person_tracker
-    
     current_time = datetime.now(timezone.utc)
     active_persons = []
     
-    with _person_id_lock:
-        for person_id, person_info in _person_tracker.items():
-            # Only return persons seen in last 30 seconds
-            time_diff = (current_time - person_info["last_seen"]).total_seconds()
-            if time_diff < 30:
-                active_persons.append({
-                    "person_id": person_id,
-                    "confidence": person_info["confidence"],
-                    "box": person_info["box"],
-                    "center_point": person_info["center_point"],
-                    "first_seen": person_info["first_seen"].isoformat(),
-                    "last_seen": person_info["last_seen"].isoformat(),
-                    "duration_seconds": (person_info["last_seen"] - person_info["first_seen"]).total_seconds()
-                })
+    # Only return persons seen in last 30 seconds, filtered on the last-seen array
+    n = len(_track_ids)
+    active = np.flatnonzero(current_time.timestamp() - _track_last_seen[:n] < TRACK_MAX_AGE_SECONDS)
+    for i in active:
+        person_id = _track_ids[i]
+        person_info = _person_tracker[person_id]
+        active_persons.append({
+            "person_id": person_id,
+            "confidence": person_info["confidence"],
+            "box": person_info["box"],
+            "center_point": person_info["center_point"],
+            "first_seen": person_info["first_seen"].isoformat(),
+            "last_seen": person_info["last_seen"].isoformat(),
+            "duration_seconds": (person_info["last_seen"] - person_info["first_seen"]).total_seconds()
+        })
     
     return {
         "active_persons": active_persons,
@@ -1119,19 +1573,29 @@ async def get_tracked_persons():
 async def capture_30_second_clip(hole_number: int = 1):
     """Capture a 30-second clip for testing purposes"""
     try:
-        # Create a mock video clip entry
         clip_id = str(uuid.uuid4())
+        file_path = f"/uploads/video_clips/mock_clip_{clip_id[:8]}.mp4"
+        
+        _read_snapshot()  # a capture means the stream is in use; keep buffering at full rate
+        # Assemble the clip from buffered snapshots (already JPEG) without touching the reader
+        clip_frames = int(CLIP_SECONDS / SNAPSHOT_INTERVAL)
+        frames = list(_recent_frames)[-clip_frames:]
+        if frames:
+            file_path = f"/uploads/video_clips/stream_clip_{clip_id[:8]}.mp4"
+            clip_path = ROOT_DIR / file_path.lstrip("/")
+            await asyncio.to_thread(_write_clip, frames, clip_path)
+        
         mock_clip = VideoClip(
             id=clip_id,
-            round_id="mock-round-" + str(uuid.uuid4())[:8],
-            subject_id="MOCK" + str(uuid.uuid4())[:6].upper(),
+            round_id="mock-round-" + secrets.token_hex(4),
+            subject_id="MOCK" + secrets.token_hex(3).upper(),
             hole_number=hole_number,
-            file_path=f"/uploads/video_clips/mock_clip_{clip_id[:8]}.mp4",
+            file_path=file_path,
             confidence_score=0.85,
             frame_accuracy_score=0.92
         )
         
-        await db.video_clips.insert_one(mock_clip.dict())
+        _clip_inserts.put_nowait(mock_clip.model_dump())
         
         return {
             "message": "30-second clip captured successfully",
@@ -1143,6 +1607,27 @@ async def capture_30_second_clip(hole_number: int = 1):
 # Include the router in the main app
 app.include_router(api_router)
 
+class _GZipExceptStreams:
+    """GZipMiddleware that leaves camera streams and uploaded media alone.
+
+    Those bodies are already-compressed JPEG/MP4. Gzip would also buffer the
+    multipart/x-mixed-replace stream and break Range requests on clips.
+    """
+    def __init__(self, app, minimum_size: int = 1024,
+                 exclude_prefixes: Tuple[str, ...] = ("/api/stream/", "/uploads/")):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+        self.exclude_prefixes = exclude_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.exclude_prefixes):
+            await self.app(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
+
+# Round lists and profiles are repetitive JSON; compress anything over 1 KB
+app.add_middleware(_GZipExceptStreams, minimum_size=1024)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,